@@ -0,0 +1,51 @@
+class GroupByAggregator:
+    """
+    Incremental group-by for the vanilla path.
+    Each group only keeps its running count, sum, min and max, so adding a row
+    is O(1) and no per-group lists are built.
+    """
+
+    def __init__(self):
+        self.groups = {}  # key -> [count, sum, min, max]
+
+    def add(self, key, value=0.0):
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [1, value, value, value]
+        else:
+            group[0] += 1
+            group[1] += value
+            if value < group[2]:
+                group[2] = value
+            if value > group[3]:
+                group[3] = value
+
+    def merge(self, other):
+        """
+        Adds the groups of an aggregator built over other rows
+        """
+        for key, (count, total, lowest, highest) in other.groups.items():
+            group = self.groups.get(key)
+            if group is None:
+                self.groups[key] = [count, total, lowest, highest]
+            else:
+                group[0] += count
+                group[1] += total
+                group[2] = min(group[2], lowest)
+                group[3] = max(group[3], highest)
+        return self
+
+    def count(self):
+        return {key: group[0] for key, group in self.groups.items()}
+
+    def sum(self):
+        return {key: group[1] for key, group in self.groups.items()}
+
+    def mean(self):
+        return {key: group[1] / group[0] for key, group in self.groups.items()}
+
+    def min(self):
+        return {key: group[2] for key, group in self.groups.items()}
+
+    def max(self):
+        return {key: group[3] for key, group in self.groups.items()}
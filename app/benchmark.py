@@ -0,0 +1,403 @@
+import argparse
+import builtins
+import contextlib
+import inspect
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import functions
+from classes import StreamingPythonAnalysis, VanillaPythonAnalysis
+from columnar import build_column_cache, load_python_columns
+from engines import get_available_engines
+from ingest import TailReader
+from parallel import split_byte_ranges
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+GENERATE_CHUNK_SIZE = 500_000
+
+# public functions that are not timed, and why
+SKIPPED_FUNCTIONS = {
+    "get_currency_client": "network client setup",
+    "fetch_rates_forex": "network request",
+    "fetch_rates_api": "network request",
+    "cached_result": "cache helper used by the timed functions",
+    "get_cached_result": "cache helper used by the timed functions",
+    "count_segment_records": "timed through count_file_lines",
+}
+
+
+def generate_dataset(path, rows, seed=0, source=None):
+    """
+    This function writes a synthetic jobs_in_data-shaped csv file.
+    Rows are resampled from the real dataset, which keeps the joint distribution
+    of countries, job categories, experience levels, etc., and salaries are
+    jittered with log-normal noise so values are not simple copies.
+    The file is written in chunks, so memory does not grow with the row count.
+    args: path (str), rows (int), seed (int), source (str) - the real dataset by default
+    """
+    base = pd.read_csv(source or functions.file_path)
+    rng = np.random.default_rng(seed)
+    with open(path, "w", newline="") as file:
+        if not rows:
+            base.head(0).to_csv(file, index=False)
+        for start in range(0, rows, GENERATE_CHUNK_SIZE):
+            size = min(GENERATE_CHUNK_SIZE, rows - start)
+            chunk = base.iloc[rng.integers(0, len(base), size)].reset_index(drop=True)
+            noise = rng.lognormal(0, 0.1, size)
+            for column in ["salary", "salary_in_usd"]:
+                chunk[column] = (chunk[column] * noise).round().astype("int64")
+            chunk.to_csv(file, header=start == 0, index=False)
+    return path
+
+
+def get_dataset(data_dir, rows, seed=0):
+    """
+    This function returns the path of a synthetic dataset, generating it if needed
+    args: data_dir (str), rows (int), seed (int)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"jobs_in_data_{rows}_{seed}.csv")
+    if not os.path.exists(path):
+        generate_dataset(path, rows, seed)
+    return path
+
+
+def get_function_cases(path):
+    """
+    This function returns (name, callable, answers) for the functions.py entry points.
+    answers are fed to input() for the interactive functions
+    args: path (str)
+    """
+    raw_data = functions.get_data_pd()
+    data = functions.treat_axis(raw_data)
+    country = data["Country"].value_counts().index[0]
+    mask = functions.get_outlier_mask(data)
+    # a reader positioned before the last tenth of the file, as if it was just appended
+    last_tenth = split_byte_ranges(path, 10)[1][-1][0]
+    return [
+        ("build_column_cache", lambda: build_column_cache(path), []),
+        ("get_data_pd", functions.get_data_pd, []),
+        ("get_data_file", functions.get_data_file, []),
+        ("get_data_csv", functions.get_data_csv, []),
+        ("count_file_lines", lambda: functions.count_file_lines(path), []),
+        ("get_total_lines", lambda: functions.get_total_lines(data), []),
+        ("treat_axis", lambda: functions.treat_axis(raw_data), []),
+        ("get_vanilla_analysis", functions.get_vanilla_analysis, []),
+        ("get_tail_reader", lambda: functions.get_tail_reader(path), []),
+        (
+            "ingest_appended_rows",
+            lambda: functions.ingest_appended_rows(data, TailReader(path, last_tenth)),
+            [],
+        ),
+        ("get_average_salary", lambda: functions.get_average_salary(data), []),
+        (
+            "get_average_salary_by_country",
+            lambda: functions.get_average_salary_by_country(data),
+            [],
+        ),
+        ("group_by_job_category", lambda: functions.group_by_job_category(data), []),
+        (
+            "get_job_categories_plan",
+            lambda: functions.get_job_categories_plan(data).collect(),
+            [],
+        ),
+        (
+            "get_job_categories_plan(country)",
+            lambda: functions.get_job_categories_plan(data, country).collect(),
+            [],
+        ),
+        (
+            "query",
+            lambda: functions.query(data).filter("Country", country).collect(),
+            [],
+        ),
+        ("get_aggregate_cube", lambda: functions.get_aggregate_cube(data), []),
+        ("get_country_index", lambda: functions.get_country_index(data), []),
+        ("get_salary_sketches", lambda: functions.get_salary_sketches(data), []),
+        (
+            "get_correlation_frames",
+            lambda: list(functions.get_correlation_frames(data)),
+            [],
+        ),
+        ("get_correlations", lambda: functions.get_correlations(data), []),
+        (
+            "get_correlation_report",
+            lambda: functions.get_correlation_report(data, "employee_residence"),
+            [],
+        ),
+        ("get_country_rows", lambda: functions.get_country_rows(data, country), []),
+        ("get_country_info", lambda: functions.get_country_info(data, country), []),
+        (
+            "export_country_data",
+            lambda: functions.export_country_data(
+                functions.get_country_rows(data, country), "yes", "benchmark"
+            ),
+            [],
+        ),
+        (
+            "export_all_data",
+            lambda: functions.export_all_data(data, "csv.gz", "benchmark_exports"),
+            [],
+        ),
+        ("get_country_stats", lambda: functions.get_country_stats(data, country), []),
+        (
+            "get_country_summary",
+            lambda: functions.get_country_summary(data, country),
+            [],
+        ),
+        ("convert_currency", lambda: functions.convert_currency("USD", "USD", 1), []),
+        ("format_currency", lambda: functions.format_currency(123456.789), []),
+        ("get_outlier_mask", lambda: functions.get_outlier_mask(data), []),
+        ("detect_outliers", lambda: functions.detect_outliers(data), ["no"]),
+        (
+            "remove_outliers",
+            lambda: functions.remove_outliers("yes", data, mask),
+            ["yes"],
+        ),
+        (
+            "restore_dateset",
+            lambda: functions.restore_dateset(True, data, raw_data),
+            ["yes"],
+        ),
+    ]
+
+
+def get_vanilla_cases(path):
+    """
+    This function returns (name, callable, answers) for every public method
+    of the vanilla analysis classes
+    args: path (str)
+    """
+    arguments = {
+        "group_by": ("employee_residence",),
+        "get_column": ("job_category",),
+        "add_records": ([],),
+    }
+    cases = []
+    for analysis_class in [VanillaPythonAnalysis, StreamingPythonAnalysis]:
+        class_name = analysis_class.__name__
+        cases.append((f"{class_name}.__init__", lambda c=analysis_class: c(path), []))
+        instance = analysis_class(path)
+        for name, method in inspect.getmembers(instance, inspect.ismethod):
+            if name.startswith("_") or name == "read_data":
+                continue
+            args = arguments.get(name, ())
+            cases.append((f"{class_name}.{name}", lambda m=method, a=args: m(*a), []))
+        cases.append(
+            (f"{class_name}.read_data", lambda i=instance: i.read_data(path), [])
+        )
+    return cases
+
+
+# analysis methods timed for every compute engine
+ENGINE_METHODS = [
+    "get_average_salary",
+    "get_salary_deviaton",
+    "get_years_deviaton",
+    "get_correlation_salary_years",
+    "get_job_category_frequency",
+    "get_tendency_per_year",
+    "get_average_salary_by_country",
+    "get_average_salary_by_category",
+    "get_lowest_salary",
+    "get_highest_salary",
+    "get_salary_quantiles",
+    "get_salary_quantiles_by_category",
+    "get_salary_histogram",
+]
+
+
+def get_engine_cases(path):
+    """
+    This function returns (name, callable, answers) for building every
+    available compute engine and for every analysis method run on it
+    args: path (str)
+    """
+    columns = load_python_columns(
+        path, ["salary_in_usd", "work_year", "job_category", "employee_residence"]
+    )
+    cases = []
+    for engine in get_available_engines():
+        analysis = VanillaPythonAnalysis(columns=columns, engine=engine)
+
+        def load(analysis=analysis):
+            analysis.engine = None
+            analysis.get_engine()
+
+        cases.append((f"{engine} engine.load", load, []))
+        analysis.get_engine()
+        for name in ENGINE_METHODS:
+            method = getattr(analysis, name)
+            cases.append((f"{engine} engine.{name}", method, []))
+    return cases
+
+
+def print_engine_table(results):
+    """
+    This function prints the total time of every compute engine per dataset size,
+    loading included
+    args: results (list)
+    """
+    totals = {}
+    for result in results:
+        engine, _, method = result["target"].partition(" engine.")
+        if method:
+            row = totals.setdefault(result["rows"], {})
+            row[engine] = row.get(engine, 0.0) + result["seconds"]
+    if not totals:
+        return
+    engines = list(next(iter(totals.values())))
+    print(f"\n{'rows':>10} " + " ".join(f"{engine:>10}" for engine in engines))
+    for rows, row in totals.items():
+        print(f"{rows:>10} " + " ".join(f"{row[engine]:>9.4f}s" for engine in engines))
+
+
+def get_missing_functions(cases):
+    """
+    This function lists the public functions of functions.py
+    that are neither timed nor explicitly skipped
+    args: cases (list)
+    """
+    timed = {name for name, _, _ in cases}
+    return sorted(
+        name
+        for name, value in inspect.getmembers(functions, inspect.isfunction)
+        if value.__module__ == "functions"
+        and not name.startswith("_")
+        and name not in timed
+        and name not in SKIPPED_FUNCTIONS
+    )
+
+
+def measure(call, answers, memory=True):
+    """
+    This function times a call and, optionally, records its peak traced memory
+    in a second run (tracing slows the code down, so it is not timed).
+    Output is discarded and input() returns the given answers, then Enter.
+    args: call (callable), answers (list), memory (bool)
+    """
+    original_input = builtins.input
+
+    def run():
+        pending = iter(answers)
+        builtins.input = lambda *args: next(pending, "")
+        functions.result_cache.clear()
+        functions.line_count_cache.clear()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            call()
+            return time.perf_counter() - start
+
+    try:
+        seconds = run()
+        peak_bytes = None
+        if memory:
+            tracemalloc.start()
+            try:
+                run()
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    finally:
+        builtins.input = original_input
+    return {"seconds": seconds, "peak_bytes": peak_bytes}
+
+
+def run_benchmarks(sizes, data_dir, seed=0, memory=True, vanilla_limit=None):
+    """
+    This function runs every benchmark case for every dataset size
+    args: sizes (list), data_dir (str), seed (int), memory (bool), vanilla_limit (int | None)
+    """
+    results = []
+    missing = []
+    original_path = functions.file_path
+    original_dir = os.getcwd()
+    data_dir = os.path.abspath(data_dir)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.chdir(work_dir)  # exports land in a throwaway folder
+            for rows in sizes:
+                path = get_dataset(data_dir, rows, seed)
+                functions.file_path = path
+                build_column_cache(path)
+                cases = get_function_cases(path)
+                missing = get_missing_functions(cases)
+                if vanilla_limit is None or rows <= vanilla_limit:
+                    cases += get_vanilla_cases(path)
+                    cases += get_engine_cases(path)
+                for name, call, answers in cases:
+                    result = {"rows": rows, "target": name}
+                    result.update(measure(call, answers, memory))
+                    results.append(result)
+                    print(f"{rows:>10} rows  {name:<50} {result['seconds']:.4f}s")
+    finally:
+        functions.file_path = original_path
+        os.chdir(original_dir)
+    return results, missing
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the analysis functions on synthetic datasets."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(functions.parent_dir, "dataset", "synthetic"),
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the peak memory runs"
+    )
+    parser.add_argument(
+        "--vanilla-limit",
+        type=int,
+        default=None,
+        help="skip the in-memory vanilla analysis above this number of rows",
+    )
+    args = parser.parse_args()
+
+    results, missing = run_benchmarks(
+        args.rows, args.data_dir, args.seed, not args.no_memory, args.vanilla_limit
+    )
+    report = {
+        "commit": get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "not_benchmarked": missing,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print_engine_table(results)
+    if missing:
+        print(f"Not benchmarked: {', '.join(missing)}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
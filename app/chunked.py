@@ -0,0 +1,161 @@
+import pandas as pd
+
+from columnar import COLUMN_NAMES
+from indexes import AggregateCube, normalize_key
+from parallel import build_cube
+
+DEFAULT_CHUNKSIZE = 500_000
+
+
+class ZScoreFilter:
+    """
+    Flags the outliers of a chunk using statistics of the whole dataset,
+    global or per group (e.g. per country), taken from the aggregate cube.
+    """
+
+    def __init__(self, cube, threshold=3, group_by=None):
+        self.threshold = threshold
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        self.group_by = group_by
+        if group_by is None:
+            total = cube.total()
+            self.mean, self.std = total["mean"], total["std"]
+        else:
+            groups = cube.rollup(group_by)
+            self.mean, self.std = groups["mean"], groups["std"]
+
+    def __call__(self, chunk):
+        salaries = chunk["Salary in USD"]
+        if self.group_by is None:
+            mean, std = self.mean, self.std
+        else:
+            if len(self.group_by) == 1:
+                keys = pd.Index(chunk[self.group_by[0]])
+            else:
+                keys = pd.MultiIndex.from_frame(chunk[self.group_by])
+            mean = self.mean.reindex(keys).to_numpy()
+            std = self.std.reindex(keys).to_numpy()
+        z_scores = (salaries - mean) / std
+        return z_scores.abs().replace(float("inf"), float("nan")) > self.threshold
+
+
+class ChunkedCountryIndex:
+    """
+    Country lookups for a ChunkedDataset: names come from the aggregate cube
+    and the rows of a country are collected in one pass over the chunks.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.names = {}
+        for name in dataset.cube.cells.index.get_level_values("Country").unique():
+            self.names.setdefault(normalize_key(name), name)
+
+    def get_name(self, country):
+        return self.names.get(normalize_key(country))
+
+    def lookup(self, data, country):
+        name = self.get_name(country)
+        if name is None:
+            return self.dataset.get_empty_frame()
+        return self.dataset.select(lambda chunk: chunk["Country"] == name)
+
+
+class ChunkedDataset:
+    """
+    Out-of-core version of the treated dataset.
+    The csv file is streamed with pd.read_csv(chunksize=...) reading only the
+    retained columns. Every chunk is reduced to an aggregate cube and the cubes
+    are merged, so the menu roll-ups never need the whole file in memory.
+    Removing outliers adds a row filter instead of copying data.
+    With workers > 1 the cube is built by a process pool over byte ranges.
+    """
+
+    def __init__(self, path, chunksize=DEFAULT_CHUNKSIZE, filters=(), workers=1):
+        self.path = path
+        self.chunksize = chunksize
+        self.filters = tuple(filters)
+        self.workers = workers
+        self._cube = None
+        self._country_index = None
+
+    def iter_chunks(self, extra_columns=()):
+        # extra_columns are other csv columns read along, under their csv names
+        for chunk in pd.read_csv(
+            self.path,
+            usecols=[*COLUMN_NAMES, *extra_columns],
+            chunksize=self.chunksize,
+        ):
+            chunk = chunk.rename(columns=COLUMN_NAMES)
+            for row_filter in self.filters:
+                chunk = chunk[~row_filter(chunk)]
+            yield chunk
+
+    @property
+    def cube(self):
+        if self._cube is None and self.workers > 1:
+            self._cube = build_cube(self.path, self.workers, self.filters)
+        if self._cube is None:
+            cubes = [AggregateCube(chunk) for chunk in self.iter_chunks()]
+            if not cubes:
+                empty = self.get_empty_frame().astype({"Salary in USD": "float64"})
+                cubes = [AggregateCube(empty)]
+            self._cube = AggregateCube.merge(cubes)
+        return self._cube
+
+    @property
+    def country_index(self):
+        if self._country_index is None:
+            self._country_index = ChunkedCountryIndex(self)
+        return self._country_index
+
+    @property
+    def shape(self):
+        return int(self.cube.cells["count"].sum()), len(COLUMN_NAMES)
+
+    def select(self, row_mask):
+        """
+        Returns the rows for which row_mask(chunk) is True, as one DataFrame
+        """
+        selected = [chunk[row_mask(chunk)] for chunk in self.iter_chunks()]
+        if not selected:
+            return self.get_empty_frame()
+        return pd.concat(selected)
+
+    def get_empty_frame(self):
+        return pd.DataFrame(columns=list(COLUMN_NAMES.values()))
+
+    def get_outlier_filter(self, threshold=3, group_by=None, method="zscore"):
+        if method != "zscore":
+            raise ValueError(
+                f"The {method} method needs exact medians, which the out-of-core mode does not compute."
+            )
+        return ZScoreFilter(self.cube, threshold, group_by)
+
+    @property
+    def removed_levels(self):
+        return len(self.filters)
+
+    def reload(self):
+        """
+        Returns the dataset without its cached aggregates, e.g. after rows
+        were appended to the csv file (rows are always streamed from the file)
+        """
+        return ChunkedDataset(self.path, self.chunksize, self.filters, self.workers)
+
+    def restore(self):
+        """
+        Returns the dataset without its last row filter
+        """
+        return ChunkedDataset(
+            self.path, self.chunksize, self.filters[:-1], self.workers
+        )
+
+    def without(self, row_filter):
+        """
+        Returns the dataset without the rows flagged by row_filter
+        """
+        return ChunkedDataset(
+            self.path, self.chunksize, self.filters + (row_filter,), self.workers
+        )
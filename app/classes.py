@@ -1,79 +1,48 @@
 import csv
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
 
+from aggregators import GroupByAggregator
+from engines import select_engine
+from ingest import TailReader, read_lines
+from profiling import profiled_class, profiler
+from sketches import DEFAULT_QUANTILES, HISTOGRAM_BINS, QuantileSketch
 
-class VanillaPythonAnalysis:
-    def __init__(self, file_path):
-        self.data = self.read_data(file_path)
-        self.salaries = [float(item.get("salary_in_usd", 0)) for item in self.data]
-        self.job_categories = [
-            item.get("job_category", "Not Available") for item in self.data
-        ]
-        self.countries = [
-            item.get("employee_residence", "Not Available") for item in self.data
-        ]
-        self.years = [int(item.get("work_year", 0)) for item in self.data]
-
-    def read_data(self, file_path):
-        with open(file_path, "r") as file:
-            data = list(csv.DictReader(file))
-        return data
-
-    def get_average_salary(self):
-        average_salary = sum(self.salaries) / len(self.salaries)
-        return average_salary
-
-    def get_salary_deviaton(self):
-        average_salary = self.get_average_salary()
-        salary_deviation = [salary - average_salary for salary in self.salaries]
-        deviation_squared = [dev**2 for dev in salary_deviation]
-        deviation_squared_mean = sum(deviation_squared) / len(deviation_squared)
-        std_dev_salaty = deviation_squared_mean**0.5
-        return std_dev_salaty
-
-    def get_years_deviaton(self):
-        mean_years = sum(self.years) / len(self.years)
-        years_deviation = [year - mean_years for year in self.years]
-        deviation_squared = [dev**2 for dev in years_deviation]
-        deviation_squared_mean = sum(deviation_squared) / len(deviation_squared)
-        std_dev_years = deviation_squared_mean**0.5
-        return std_dev_years, mean_years
-
-    def get_job_category_frequency(self):
-        frequency = {}
-        for category in self.job_categories:
-            frequency[category] = frequency.get(category, 0) + 1
-        return sorted(frequency.items(), key=lambda x: x[1], reverse=True)
-
-    def get_correlation_salary_years(self):
-        mean_salary = self.get_average_salary()
-        salary_deviation = self.get_salary_deviaton()
-        work_years_deviation, mean_years = self.get_years_deviaton()
-
-        covariance = sum(
-            (year - mean_years) * (salary - mean_salary)
-            for year, salary in zip(self.years, self.salaries)
-        ) / len(self.years)
 
-        correlation = covariance / (work_years_deviation * salary_deviation)
-        return correlation
+@profiled_class
+class SalaryAnalysis:
+    """
+    Statistics API shared by the vanilla analyses. Subclasses load csv rows
+    (dictionaries) with add_records and compute the get_* statistics,
+    update() adds the rows appended to the csv file since it was last read
+    and get_insights() prints the report of option 8.
+    """
 
-    def get_tendency_per_year(self):
-        salary_by_year = {}
-        for year, salary in zip(self.years, self.salaries):
-            salary_by_year[year] = salary_by_year.get(year, []) + [salary]
-        average_salary_by_year = {
-            year: sum(salaries) / len(salaries)
-            for year, salaries in salary_by_year.items()
-        }
-        return sorted(average_salary_by_year.items())
-
-    def get_lowest_salary(self):
-        lowest_salary = min(self.salaries)
-        return lowest_salary
+    @profiler.phase("parse")
+    def read_tail(self):
+        """
+        Returns the rows appended to the csv file since it was last read.
+        Raises ValueError if the file was rewritten
+        """
+        if self.tail is None:
+            raise ValueError("This analysis does not track a csv file.")
+        tail = self.tail.read_tail()
+        if not tail:
+            return []
+        text = (self.tail.header + tail).decode("utf-8")
+        return list(csv.DictReader(io.StringIO(text, newline="")))
 
-    def get_highest_salary(self):
-        highest_salary = max(self.salaries)
-        return highest_salary
+    def update(self):
+        """
+        Adds the rows appended to the csv file since it was last read,
+        parsing only those rows. Returns the number of new rows
+        """
+        records = self.read_tail()
+        self.add_records(records)
+        return len(records)
 
     def get_insights(self):
         print("\n===================== Salary Analysis =====================\n")
@@ -130,3 +99,462 @@ class VanillaPythonAnalysis:
         print("The lowest salary is the minimum amount earned by an employee.")
         print("The highest salary is the maximum amount earned by an employee.")
         print("\n============================================================\n")
+
+        print("\n=================== Salary Distribution ====================\n")
+        quantiles = self.get_salary_quantiles()
+        print(f"10th Percentile: ${quantiles['p10']:,.2f}")
+        print(f"Median Salary: ${quantiles['median']:,.2f}")
+        print(f"90th Percentile: ${quantiles['p90']:,.2f}")
+        print(f"99th Percentile: ${quantiles['p99']:,.2f}\n")
+        histogram = self.get_salary_histogram()
+        largest = max(count for _, _, count in histogram)
+        for low, high, count in histogram:
+            bar = "#" * round(40 * count / largest)
+            print(f"${low:>11,.0f} - ${high:>11,.0f}: {count:>8} {bar}")
+        print()
+        for category, category_quantiles in self.get_salary_quantiles_by_category():
+            print(
+                f"Category: {category}, Median Salary: ${category_quantiles['median']:,.2f}"
+            )
+        print(
+            "\nUnlike the average, the median is not pulled up by the few very high salaries."
+        )
+        print("\n============================================================\n")
+
+
+class SalaryAccumulator:
+    """
+    Single-pass accumulator for the salary statistics.
+    Uses Welford's updates for the means and squared deviations, a running
+    co-moment for the salary/year covariance and quantile sketches for the
+    salary distribution, so memory stays bounded regardless of the number of rows.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean_salary = 0.0
+        self.m2_salary = 0.0
+        self.mean_year = 0.0
+        self.m2_year = 0.0
+        self.co_moment = 0.0
+        self.lowest_salary = None
+        self.highest_salary = None
+        self.by_category = GroupByAggregator()
+        self.by_country = GroupByAggregator()
+        self.by_country_category = GroupByAggregator()
+        self.by_year = GroupByAggregator()
+        self.salary_sketch = QuantileSketch()
+        self.category_sketches = {}
+
+    def add(self, salary, year, category, country="Not Available"):
+        self.count += 1
+        delta_salary = salary - self.mean_salary
+        delta_year = year - self.mean_year
+        self.mean_salary += delta_salary / self.count
+        self.mean_year += delta_year / self.count
+        self.m2_salary += delta_salary * (salary - self.mean_salary)
+        self.m2_year += delta_year * (year - self.mean_year)
+        self.co_moment += delta_year * (salary - self.mean_salary)
+
+        if self.lowest_salary is None or salary < self.lowest_salary:
+            self.lowest_salary = salary
+        if self.highest_salary is None or salary > self.highest_salary:
+            self.highest_salary = salary
+
+        self.by_category.add(category, salary)
+        self.by_country.add(country, salary)
+        self.by_country_category.add((country, category), salary)
+        self.by_year.add(year, salary)
+        self.salary_sketch.add(salary)
+        if category not in self.category_sketches:
+            self.category_sketches[category] = QuantileSketch()
+        self.category_sketches[category].add(salary)
+
+    def merge(self, other):
+        """
+        Combines the statistics of another accumulator built over other rows,
+        using the pairwise update of Chan et al., so the result is the same
+        as a single pass over all the rows
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        count = self.count + other.count
+        weight = self.count * other.count / count
+        delta_salary = other.mean_salary - self.mean_salary
+        delta_year = other.mean_year - self.mean_year
+        self.m2_salary += other.m2_salary + delta_salary**2 * weight
+        self.m2_year += other.m2_year + delta_year**2 * weight
+        self.co_moment += other.co_moment + delta_year * delta_salary * weight
+        self.mean_salary += delta_salary * other.count / count
+        self.mean_year += delta_year * other.count / count
+        self.count = count
+
+        self.lowest_salary = min(self.lowest_salary, other.lowest_salary)
+        self.highest_salary = max(self.highest_salary, other.highest_salary)
+        self.by_category.merge(other.by_category)
+        self.by_country.merge(other.by_country)
+        self.by_country_category.merge(other.by_country_category)
+        self.by_year.merge(other.by_year)
+        self.salary_sketch.merge(other.salary_sketch)
+        for category, sketch in other.category_sketches.items():
+            if category not in self.category_sketches:
+                self.category_sketches[category] = QuantileSketch()
+            self.category_sketches[category].merge(sketch)
+        return self
+
+
+@profiled_class
+class VanillaPythonAnalysis(SalaryAnalysis):
+    """
+    Analysis over the rows of the csv file (or its cached columns), kept in
+    memory so they can be grouped by any column. The statistics are computed
+    by a pluggable engine, see engines.py.
+    """
+
+    def __init__(self, file_path=None, columns=None, tail=None, engine="auto"):
+        # columns (column name -> list of values) skips parsing the csv file,
+        # e.g. when they come from the columnar cache.
+        # tail (TailReader) knows how much of the csv file the columns cover,
+        # update() then only parses the rows appended after that.
+        # engine computes the statistics: "python", "numpy", "pandas",
+        # or "auto" to pick one by the number of rows
+        select_engine(0, engine)  # unknown or missing engines fail here
+        self.engine_name = engine
+        self.engine = None
+        if columns is None:
+            self.tail = TailReader(file_path)
+            self.data = []
+            self.salaries = []
+            self.job_categories = []
+            self.countries = []
+            self.years = []
+            self.add_records(self.read_data(file_path, self.tail.offset))
+        else:
+            self.tail = tail
+            self.data = None
+            self.columns = columns
+            self.salaries = [float(salary) for salary in columns["salary_in_usd"]]
+            self.job_categories = list(columns["job_category"])
+            self.countries = list(columns["employee_residence"])
+            self.years = [int(year) for year in columns["work_year"]]
+
+    @profiler.phase("parse")
+    def read_data(self, file_path, end=None):
+        # end stops reading at a byte offset, e.g. the one of a TailReader
+        return list(csv.DictReader(read_lines(file_path, end)))
+
+    def add_records(self, records):
+        """
+        Appends csv rows (dictionaries) to the analysed data
+        args: records (list)
+        """
+        if self.data is not None:
+            self.data += records
+        else:
+            for name, values in self.columns.items():
+                # the csv strings take the type of the column, e.g. int for work_year
+                column_type = type(values[0]) if values else str
+                default = "Not Available" if column_type is str else column_type()
+                values.extend(column_type(item.get(name, default)) for item in records)
+        self.salaries += [float(item.get("salary_in_usd", 0)) for item in records]
+        self.job_categories += [
+            item.get("job_category", "Not Available") for item in records
+        ]
+        self.countries += [
+            item.get("employee_residence", "Not Available") for item in records
+        ]
+        self.years += [int(item.get("work_year", 0)) for item in records]
+        self.engine = None  # rebuilt over all the rows on next use
+
+    def get_engine(self):
+        """
+        Returns the compute engine, built over the current rows on first use
+        """
+        if self.engine is None:
+            engine_class = select_engine(len(self.salaries), self.engine_name)
+            self.engine = engine_class(
+                self.salaries, self.years, self.job_categories, self.countries
+            )
+        return self.engine
+
+    def get_average_salary(self):
+        return self.get_engine().average_salary()
+
+    def get_salary_deviaton(self):
+        return self.get_engine().salary_deviation()
+
+    def get_years_deviaton(self):
+        return self.get_engine().years_deviation()
+
+    def group_by(self, *keys):
+        """
+        Aggregates the salaries by one or more columns of the csv file
+        (e.g. "employee_residence", "job_category").
+        Single keys are used as is, multiple keys are combined in a tuple.
+        args: keys (str)
+        """
+        aggregator = GroupByAggregator()
+        if len(keys) == 1:
+            group_keys = self.get_column(keys[0])
+        else:
+            group_keys = zip(*(self.get_column(column) for column in keys))
+        for key, salary in zip(group_keys, self.salaries):
+            aggregator.add(key, salary)
+        return aggregator
+
+    def get_column(self, name):
+        if self.data is None:
+            return self.columns[name]
+        return [item.get(name, "Not Available") for item in self.data]
+
+    def get_job_category_frequency(self):
+        frequency = self.get_engine().job_category_frequency()
+        return sorted(frequency.items(), key=lambda x: x[1], reverse=True)
+
+    def get_correlation_salary_years(self):
+        return self.get_engine().correlation_salary_years()
+
+    def get_tendency_per_year(self):
+        return sorted(self.get_engine().tendency_per_year().items())
+
+    def get_average_salary_by_country(self):
+        return sorted(self.get_engine().average_salary_by_country().items())
+
+    def get_average_salary_by_category(self):
+        return sorted(self.get_engine().average_salary_by_category().items())
+
+    def get_lowest_salary(self):
+        return self.get_engine().lowest_salary()
+
+    def get_highest_salary(self):
+        return self.get_engine().highest_salary()
+
+    def get_salary_quantiles(self, quantiles=DEFAULT_QUANTILES):
+        """
+        Returns the salary of every quantile, e.g. {"median": 115000.0}
+        args: quantiles (dict) - name -> quantile between 0 and 1
+        """
+        return self.get_engine().salary_quantiles(quantiles)
+
+    def get_salary_quantiles_by_category(self, quantiles=DEFAULT_QUANTILES):
+        return sorted(self.get_engine().salary_quantiles_by_category(quantiles).items())
+
+    def get_salary_histogram(self, bins=HISTOGRAM_BINS):
+        """
+        Returns the (low edge, high edge, count) of `bins` equal-width salary bins
+        """
+        return self.get_engine().salary_histogram(bins)
+
+
+@profiled_class
+class StreamingPythonAnalysis(SalaryAnalysis):
+    """
+    Same statistics as VanillaPythonAnalysis, but the file is consumed row by row
+    into a SalaryAccumulator instead of being kept in memory, so there are no
+    rows to group by other columns.
+    """
+
+    def __init__(self, file_path=None, columns=None, stats=None, tail=None):
+        # stats is an already filled SalaryAccumulator, e.g. from the parallel engine
+        self.tail = tail
+        if stats is not None:
+            self.stats = stats
+        elif columns is None:
+            self.stats = SalaryAccumulator()
+            self.tail = TailReader(file_path)
+            self.read_data(file_path, self.tail.offset)
+        else:
+            self.stats = SalaryAccumulator()
+            countries = columns.get("employee_residence")
+            if countries is None:
+                countries = ["Not Available"] * len(columns["salary_in_usd"])
+            for salary, year, category, country in zip(
+                columns["salary_in_usd"],
+                columns["work_year"],
+                columns["job_category"],
+                countries,
+            ):
+                self.stats.add(float(salary), int(year), category, country)
+
+    @profiler.phase("parse")
+    def read_data(self, file_path, end=None):
+        self.add_records(csv.DictReader(read_lines(file_path, end)))
+
+    def add_records(self, records):
+        # the running statistics are updated, nothing is recomputed
+        for item in records:
+            self.stats.add(
+                float(item.get("salary_in_usd", 0)),
+                int(item.get("work_year", 0)),
+                item.get("job_category", "Not Available"),
+                item.get("employee_residence", "Not Available"),
+            )
+
+    def get_average_salary(self):
+        return self.stats.mean_salary
+
+    def get_salary_deviaton(self):
+        return (self.stats.m2_salary / self.stats.count) ** 0.5
+
+    def get_years_deviaton(self):
+        std_dev_years = (self.stats.m2_year / self.stats.count) ** 0.5
+        return std_dev_years, self.stats.mean_year
+
+    def get_job_category_frequency(self):
+        return sorted(
+            self.stats.by_category.count().items(), key=lambda x: x[1], reverse=True
+        )
+
+    def get_correlation_salary_years(self):
+        return self.stats.co_moment / (self.stats.m2_year * self.stats.m2_salary) ** 0.5
+
+    def get_tendency_per_year(self):
+        return sorted(self.stats.by_year.mean().items())
+
+    def get_average_salary_by_country(self):
+        return sorted(self.stats.by_country.mean().items())
+
+    def get_average_salary_by_category(self):
+        return sorted(self.stats.by_category.mean().items())
+
+    def get_lowest_salary(self):
+        return self.stats.lowest_salary
+
+    def get_highest_salary(self):
+        return self.stats.highest_salary
+
+    def get_salary_quantiles(self, quantiles=DEFAULT_QUANTILES):
+        # estimated from the quantile sketches, the rows are not kept
+        return self.stats.salary_sketch.quantiles(quantiles)
+
+    def get_salary_quantiles_by_category(self, quantiles=DEFAULT_QUANTILES):
+        return sorted(
+            (category, sketch.quantiles(quantiles))
+            for category, sketch in self.stats.category_sketches.items()
+        )
+
+    def get_salary_histogram(self, bins=HISTOGRAM_BINS):
+        return self.stats.salary_sketch.histogram(bins)
+
+
+class ExchangeRateCache:
+    """
+    Exchange rates fetched at most once per base currency and TTL.
+    Rate tables are persisted to a local JSON store, so conversions keep
+    working offline with the last known rates.
+    sources are callables taking a base currency and returning {currency: rate};
+    they are tried in order until one succeeds.
+    """
+
+    def __init__(self, store_path, sources, ttl=12 * 60 * 60):
+        self.store_path = store_path
+        self.sources = sources
+        self.ttl = ttl
+        self.tables = self.read_store()
+
+    def read_store(self):
+        try:
+            with open(self.store_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def write_store(self):
+        try:
+            with open(self.store_path, "w") as file:
+                json.dump(self.tables, file)
+        except OSError:
+            pass  # the in-memory rates are still usable
+
+    def get_rates(self, base):
+        table = self.tables.get(base)
+        if table is not None and time.time() - table["timestamp"] < self.ttl:
+            return table["rates"]
+
+        for source in self.sources:
+            try:
+                rates = dict(source(base))
+            except Exception:
+                continue
+            self.tables[base] = {"timestamp": time.time(), "rates": rates}
+            self.write_store()
+            return rates
+
+        if table is not None:
+            return table["rates"]  # offline: stale rates are better than none
+        raise LookupError(f"No exchange rates available for {base}.")
+
+    def get_rate(self, base, target):
+        if base == target:
+            return 1.0
+        rates = self.get_rates(base)
+        if target not in rates:
+            raise LookupError(f"No exchange rate from {base} to {target}.")
+        return rates[target]
+
+
+class ResultCache:
+    """
+    LRU cache for analysis results.
+    Keys are combined with the dataset generation, which is bumped whenever
+    the dataset changes (e.g. outliers removed or restored), so results from
+    an older version of the data are never returned.
+    The cache can be shared by threads (e.g. the query service workers):
+    a lock guards the entries, but not the computations.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def bump(self):
+        self.generation += 1
+
+    def get_or_compute(self, key, compute, versioned=True):
+        # versioned=False is for results that do not depend on the dataset state
+        key = (self.generation if versioned else None, key)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def get(self, key, default=None, versioned=True):
+        """
+        Returns a cached value without computing it, or default
+        """
+        key = (self.generation if versioned else None, key)
+        with self.lock:
+            return self.entries.get(key, default)
+
+    def discard(self, key, versioned=True):
+        with self.lock:
+            self.entries.pop((self.generation if versioned else None, key), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+        }
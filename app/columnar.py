@@ -0,0 +1,285 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiler
+
+CACHE_VERSION = 3
+
+# columns dropped by treat_axis and the readable names of the ones it keeps
+REMOVED_COLUMNS = [
+    "work_year",
+    "job_title",
+    "salary_currency",
+    "salary",
+    "company_size",
+]
+COLUMN_NAMES = {
+    "job_category": "Job category",
+    "employee_residence": "Country",
+    "experience_level": "Experience level",
+    "employment_type": "Employment type",
+    "work_setting": "Work setting",
+    "company_location": "Company location",
+    "salary_in_usd": "Salary in USD",
+}
+# low-cardinality text columns stored as categoricals by the compact load schema
+CATEGORY_COLUMNS = [
+    "job_category",
+    "employee_residence",
+    "experience_level",
+    "employment_type",
+    "work_setting",
+    "company_location",
+]
+
+
+def get_cache_dir(csv_path):
+    """
+    This function returns the folder where the columnar cache of a csv file lives
+    args: csv_path (str)
+    """
+    folder, name = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(folder, ".cache", os.path.splitext(name)[0])
+
+
+def get_source_signature(csv_path):
+    """
+    This function returns what identifies a version of the csv file
+    args: csv_path (str)
+    """
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_cache_meta(csv_path):
+    """
+    This function returns the cache metadata, or None if there is no cache
+    or it was built from a different version of the csv file
+    args: csv_path (str)
+    """
+    meta_path = os.path.join(get_cache_dir(csv_path), "meta.json")
+    try:
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    if meta.get("source") != get_source_signature(csv_path):
+        return None
+    return meta
+
+
+@profiler.phase("parse")
+def build_column_cache(csv_path):
+    """
+    This function parses the csv file once and stores every column as a .npy file.
+    Text columns are stored as integer category codes plus their categories.
+    The metadata is written last, so a half-written cache is never used.
+    args: csv_path (str)
+    """
+    signature = get_source_signature(csv_path)
+    data = pd.read_csv(csv_path)
+    cache_dir = get_cache_dir(csv_path)
+    meta = {"version": CACHE_VERSION, "source": signature}
+    return save_columns(data, cache_dir, meta)
+
+
+def get_code_dtype(count):
+    """
+    This function returns the integer type pandas uses for the codes of a
+    Categorical with `count` categories, so the cached codes are used as they
+    are mapped from the file instead of being converted
+    args: count (int)
+    """
+    for dtype in [np.int8, np.int16, np.int32]:
+        if count < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def replace_file(path, write):
+    """
+    This function writes a file next to `path` and then moves it into place.
+    Frames still memory-mapping the previous file keep reading it, instead of
+    seeing it rewritten under them
+    args: path (str), write (callable) - writes the content to a binary file
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        write(file)
+    os.replace(temporary, path)
+
+
+def save_columns(data, folder, meta=None):
+    """
+    This function stores every column of a DataFrame as a .npy file,
+    then the metadata (row count and column kinds) as meta.json.
+    Existing files are replaced, not overwritten, see replace_file
+    args: data (DataFrame), folder (str), meta (dict | None) - extra metadata
+    """
+    os.makedirs(folder, exist_ok=True)
+    columns = {}
+    for name in data.columns:
+        column = data[name]
+        if column.dtype == object or isinstance(column.dtype, pd.CategoricalDtype):
+            # sorted categories keep groupby results in alphabetical order
+            codes, categories = pd.factorize(column, sort=True)
+            values = codes.astype(get_code_dtype(len(categories)))
+            columns[name] = {"kind": "category", "categories": categories.tolist()}
+        else:
+            values = column.to_numpy()
+            columns[name] = {"kind": "numeric"}
+        replace_file(
+            os.path.join(folder, f"{name}.npy"),
+            lambda file, values=values: np.save(file, values),
+        )
+
+    meta = dict(meta or {}, rows=len(data), columns=columns)
+    replace_file(
+        os.path.join(folder, "meta.json"),
+        lambda file: file.write(json.dumps(meta).encode("utf-8")),
+    )
+    return meta
+
+
+def get_cached_size(csv_path):
+    """
+    This function returns the size of the csv file the cache was built from,
+    i.e. the bytes the cached columns cover, or None if there is no cache
+    args: csv_path (str)
+    """
+    try:
+        with open(os.path.join(get_cache_dir(csv_path), "meta.json"), "r") as file:
+            return json.load(file)["source"]["size"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_cache_meta(csv_path):
+    """
+    This function returns valid cache metadata, building the cache if needed
+    args: csv_path (str)
+    """
+    meta = read_cache_meta(csv_path)
+    if meta is None:
+        meta = build_column_cache(csv_path)
+    return meta
+
+
+def load_columns(csv_path, names=None):
+    """
+    This function loads columns from the cache as memory-mapped arrays.
+    Text columns are returned as pandas Categoricals built from the stored codes.
+    args: csv_path (str), names (list | None) - all columns by default
+    """
+    meta = get_cache_meta(csv_path)
+    cache_dir = get_cache_dir(csv_path)
+    if names is None:
+        names = list(meta["columns"])
+    else:
+        names = [name for name in meta["columns"] if name in names]  # file order
+
+    columns = {}
+    for name in names:
+        info = meta["columns"][name]
+        values = np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+        if info["kind"] == "category":
+            columns[name] = pd.Categorical.from_codes(
+                values, categories=info["categories"]
+            )
+        else:
+            columns[name] = values
+    return columns
+
+
+@profiler.phase("load")
+def load_frame(csv_path, names=None, compact=False):
+    """
+    This function returns the same DataFrame as pd.read_csv, read from the cache.
+    names limits the columns that are loaded (like usecols). With compact=True
+    the CATEGORY_COLUMNS stay categoricals and integer columns are downcast to
+    the smallest type that holds their values, which takes several times less memory
+    args: csv_path (str), names (list | None), compact (bool)
+    """
+    try:
+        columns = load_columns(csv_path, names)
+    except PermissionError:
+        # the cache cannot be written next to the csv
+        dtype = None
+        if compact:
+            dtype = {name: "category" for name in CATEGORY_COLUMNS}
+        data = pd.read_csv(csv_path, usecols=names, dtype=dtype)
+        return downcast_integers(data) if compact else data
+
+    frame = {}
+    for name, values in columns.items():
+        if isinstance(values, pd.Categorical):
+            if compact and name in CATEGORY_COLUMNS:
+                frame[name] = values  # over the memory-mapped codes
+            else:
+                frame[name] = np.asarray(values.astype(object))  # like pd.read_csv
+        else:
+            frame[name] = np.asarray(values)  # an ndarray view of the mapped file
+    # copy=False keeps every memory-mapped column as its own block, not copied
+    data = pd.DataFrame(frame, copy=False)
+    return downcast_integers(data) if compact else data
+
+
+def concat_frames(data, rows):
+    """
+    This function appends rows to a frame, keeping its compact types:
+    categoricals get the sorted union of both categories and integer columns
+    stay in the smallest type that holds them. The new rows are numbered
+    after the last index of the frame
+    args: data (DataFrame), rows (DataFrame) - same columns
+    """
+    data = data.copy(deep=False)
+    rows = rows[list(data.columns)].copy()
+    start = data.index.max() + 1 if len(data) else 0
+    rows.index = pd.RangeIndex(start, start + len(rows))
+    for name in data.columns:
+        if isinstance(data[name].dtype, pd.CategoricalDtype):
+            categories = data[name].cat.categories.union(rows[name].dropna().unique())
+            data[name] = data[name].cat.set_categories(categories)
+            rows[name] = rows[name].astype(pd.CategoricalDtype(categories))
+    combined = pd.concat([data, rows])
+    for name in data.select_dtypes("integer").columns:
+        if combined[name].dtype != data[name].dtype:
+            combined[name] = pd.to_numeric(combined[name], downcast="integer")
+    return combined
+
+
+def downcast_integers(data):
+    """
+    This function stores every integer column in the smallest safe integer type
+    args: data (DataFrame)
+    """
+    for name in data.select_dtypes("integer").columns:
+        data[name] = pd.to_numeric(data[name], downcast="integer")
+    return data
+
+
+@profiler.phase("load")
+def load_python_columns(csv_path, names):
+    """
+    This function returns cached columns as plain Python lists,
+    which is what the vanilla analysis works with
+    args: csv_path (str), names (list)
+    """
+    try:
+        columns = load_columns(csv_path, names)
+    except PermissionError:
+        data = pd.read_csv(csv_path, usecols=names)
+        return {name: data[name].tolist() for name in names}
+    return {
+        name: (
+            list(values.astype(object))
+            if isinstance(values, pd.Categorical)
+            else values.tolist()
+        )
+        for name, values in columns.items()
+    }
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from profiling import profiler
+
+BLOCK_ROWS = 65_536  # rows encoded and multiplied at once
+NUMERIC_FEATURES = ["salary_in_usd", "work_year"]
+# ordered levels of the ordinal columns
+ORDINAL_FEATURES = {
+    "experience_level": {"Entry-level": 0, "Mid-level": 1, "Senior": 2, "Executive": 3},
+    "company_size": {"S": 0, "M": 1, "L": 2},
+}
+# one indicator column per value of the nominal columns
+ONE_HOT_FEATURES = {
+    "work_setting": ["In-person", "Hybrid", "Remote"],
+    "employment_type": ["Full-time", "Part-time", "Contract", "Freelance"],
+}
+CORRELATION_COLUMNS = NUMERIC_FEATURES + list(ORDINAL_FEATURES) + list(ONE_HOT_FEATURES)
+FEATURE_NAMES = (
+    NUMERIC_FEATURES
+    + list(ORDINAL_FEATURES)
+    + [
+        f"{column}={value}"
+        for column, values in ONE_HOT_FEATURES.items()
+        for value in values
+    ]
+)
+# columns the correlations can be computed per value of
+CORRELATION_GROUPS = [
+    "job_category",
+    "employee_residence",
+    "experience_level",
+    "company_size",
+    "work_setting",
+]
+
+
+def encode_features(data):
+    """
+    This function encodes the rows of a csv-shaped DataFrame as a float matrix
+    with one column per FEATURE_NAMES entry. Rows with a missing or unknown
+    value are NaN in that column
+    args: data (DataFrame)
+    """
+    features = np.empty((len(data), len(FEATURE_NAMES)))
+    position = 0
+    for column in NUMERIC_FEATURES:
+        features[:, position] = data[column].to_numpy(dtype="float64")
+        position += 1
+    for column, levels in ORDINAL_FEATURES.items():
+        features[:, position] = data[column].map(levels).astype("float64")
+        position += 1
+    for column, values in ONE_HOT_FEATURES.items():
+        known = data[column].isin(values).to_numpy()
+        for value in values:
+            features[:, position] = np.where(
+                known, (data[column] == value).to_numpy(dtype="float64"), np.nan
+            )
+            position += 1
+    return features
+
+
+class CovarianceAccumulator:
+    """
+    Count, means and co-moment matrix of the encoded features.
+    Every block of rows is reduced with one matrix product and combined with
+    the pairwise update of Chan et al. (like SalaryAccumulator.merge), so the
+    whole matrix is built in a single pass and accumulators of disjoint rows
+    can be merged.
+    """
+
+    def __init__(self, names=FEATURE_NAMES):
+        self.names = list(names)
+        self.count = 0
+        self.mean = np.zeros(len(self.names))
+        self.co_moments = np.zeros((len(self.names), len(self.names)))
+
+    def update(self, features):
+        """
+        Adds the rows of an encoded block
+        args: features (ndarray) - rows x features
+        """
+        if len(features) == 0:
+            return self
+        mean = features.mean(axis=0)
+        centered = features - mean
+        return self.add_moments(len(features), mean, centered.T @ centered)
+
+    def merge(self, other):
+        """
+        Adds the moments of an accumulator built over other rows
+        """
+        if other.count == 0:
+            return self
+        return self.add_moments(other.count, other.mean, other.co_moments)
+
+    def add_moments(self, count, mean, co_moments):
+        total = self.count + count
+        delta = mean - self.mean
+        self.co_moments += co_moments + np.outer(delta, delta) * (
+            self.count * count / total
+        )
+        self.mean += delta * count / total
+        self.count = total
+        return self
+
+    def covariance(self):
+        """
+        Returns the (population) covariance matrix as a labelled DataFrame
+        """
+        return pd.DataFrame(
+            self.co_moments / self.count, index=self.names, columns=self.names
+        )
+
+    def correlation(self):
+        """
+        Returns the Pearson correlation matrix as a labelled DataFrame,
+        NaN for features that do not vary (e.g. a group with a single company size)
+        """
+        deviations = np.sqrt(np.diag(self.co_moments))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            matrix = self.co_moments / np.outer(deviations, deviations)
+        return pd.DataFrame(matrix, index=self.names, columns=self.names)
+
+
+@profiler.phase("aggregate")
+def accumulate_covariance(frames, group_by=None, block_rows=BLOCK_ROWS):
+    """
+    This function builds the covariance accumulator of csv-shaped frames
+    (e.g. the chunks of the csv file) one block of rows at a time and,
+    with group_by, one accumulator per value of that column as well.
+    Rows with a missing or unknown value are left out.
+    Returns the accumulator of all the rows and a dict of the groups
+    args: frames (iterable of DataFrame), group_by (str | None), block_rows (int)
+    """
+    total = CovarianceAccumulator()
+    groups = {}
+    for frame in frames:
+        for start in range(0, len(frame), block_rows):
+            block = frame.iloc[start : start + block_rows]
+            features = encode_features(block)
+            complete = ~np.isnan(features).any(axis=1)
+            features = features[complete]
+            total.update(features)
+            if group_by is None:
+                continue
+            codes, keys = pd.factorize(block[group_by].to_numpy()[complete])
+            # rows sorted by group, so every group is a contiguous slice
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+            ends = np.cumsum(counts) + np.count_nonzero(codes < 0)
+            for key, count, end in zip(keys, counts, ends):
+                if key not in groups:
+                    groups[key] = CovarianceAccumulator()
+                groups[key].update(features[order[end - count : end]])
+    return total, groups
@@ -0,0 +1,329 @@
+import importlib.util
+
+from aggregators import GroupByAggregator
+from sketches import get_exact_quantiles, get_histogram, get_rank_index
+
+# rows from which the automatic choice moves from pure Python to NumPy,
+# below it converting the lists to arrays costs more than it saves
+NUMPY_MIN_ROWS = 1_000
+
+
+def get_array_quantiles(np, salaries, quantiles):
+    """
+    This function returns the exact quantiles of a NumPy array, with the
+    definition used by the sketches
+    args: np (module), salaries (ndarray), quantiles (dict) - name -> quantile
+    """
+    values = np.quantile(salaries, list(quantiles.values()), method="inverted_cdf")
+    return dict(zip(quantiles, values.tolist()))
+
+
+def get_array_histogram(np, salaries, bins):
+    """
+    This function is the vectorized get_histogram of a NumPy array
+    args: np (module), salaries (ndarray), bins (int)
+    """
+    lowest, highest = salaries.min().item(), salaries.max().item()
+    width = (highest - lowest) / bins or 1.0
+    positions = np.minimum(((salaries - lowest) / width).astype(np.int64), bins - 1)
+    counts = np.bincount(positions, minlength=bins).tolist()
+    return [
+        (lowest + width * position, lowest + width * (position + 1), count)
+        for position, count in enumerate(counts)
+    ]
+
+
+class PythonEngine:
+    """
+    Computes the vanilla analysis over plain Python lists, with no dependency.
+    Every engine takes the same four columns and returns plain Python values,
+    so they can be swapped without changing the results.
+    """
+
+    name = "python"
+
+    def __init__(self, salaries, years, job_categories, countries):
+        self.salaries = salaries
+        self.years = years
+        self.job_categories = job_categories
+        self.countries = countries
+
+    def average_salary(self):
+        return sum(self.salaries) / len(self.salaries)
+
+    def salary_deviation(self):
+        average_salary = self.average_salary()
+        deviation_squared = [(salary - average_salary) ** 2 for salary in self.salaries]
+        return (sum(deviation_squared) / len(deviation_squared)) ** 0.5
+
+    def years_deviation(self):
+        mean_years = sum(self.years) / len(self.years)
+        deviation_squared = [(year - mean_years) ** 2 for year in self.years]
+        std_dev_years = (sum(deviation_squared) / len(deviation_squared)) ** 0.5
+        return std_dev_years, mean_years
+
+    def correlation_salary_years(self):
+        mean_salary = self.average_salary()
+        std_dev_years, mean_years = self.years_deviation()
+        covariance = sum(
+            (year - mean_years) * (salary - mean_salary)
+            for year, salary in zip(self.years, self.salaries)
+        ) / len(self.years)
+        return covariance / (std_dev_years * self.salary_deviation())
+
+    def job_category_frequency(self):
+        # categories in order of first appearance, so ties keep that order once sorted
+        return self.group_by(self.job_categories).count()
+
+    def group_by(self, keys):
+        aggregator = GroupByAggregator()
+        for key, salary in zip(keys, self.salaries):
+            aggregator.add(key, salary)
+        return aggregator
+
+    def tendency_per_year(self):
+        return self.group_by(self.years).mean()
+
+    def average_salary_by_country(self):
+        return self.group_by(self.countries).mean()
+
+    def average_salary_by_category(self):
+        return self.group_by(self.job_categories).mean()
+
+    def lowest_salary(self):
+        return min(self.salaries)
+
+    def highest_salary(self):
+        return max(self.salaries)
+
+    def salary_quantiles(self, quantiles):
+        return get_exact_quantiles(sorted(self.salaries), quantiles)
+
+    def salary_quantiles_by_category(self, quantiles):
+        groups = {}
+        for category, salary in zip(self.job_categories, self.salaries):
+            groups.setdefault(category, []).append(salary)
+        return {
+            category: get_exact_quantiles(sorted(salaries), quantiles)
+            for category, salaries in groups.items()
+        }
+
+    def salary_histogram(self, bins):
+        return get_histogram(
+            ((salary, 1) for salary in self.salaries),
+            self.lowest_salary(),
+            self.highest_salary(),
+            bins,
+        )
+
+
+class NumpyEngine:
+    """
+    Computes the vanilla analysis over NumPy arrays. The text columns are
+    encoded once as integer codes, so the group-bys are single bincount calls.
+    """
+
+    name = "numpy"
+
+    def __init__(self, salaries, years, job_categories, countries):
+        import numpy as np
+
+        self.np = np
+        self.salaries = np.asarray(salaries, dtype=np.float64)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.job_categories = self.encode(job_categories)
+        self.countries = self.encode(countries)
+
+    def encode(self, values):
+        # (keys in order of first appearance, code of every row); a dict
+        # assigns the codes faster than np.unique sorts an object array
+        keys = {}
+        codes = self.np.fromiter(
+            (keys.setdefault(value, len(keys)) for value in values),
+            dtype=self.np.int64,
+            count=len(values),
+        )
+        return list(keys), codes
+
+    def average_salary(self):
+        return float(self.salaries.mean())
+
+    def salary_deviation(self):
+        return float(self.salaries.std())
+
+    def years_deviation(self):
+        return float(self.years.std()), float(self.years.mean())
+
+    def correlation_salary_years(self):
+        years = self.years - self.years.mean()
+        salaries = self.salaries - self.salaries.mean()
+        covariance = (years * salaries).mean()
+        return float(covariance / (self.years.std() * self.salaries.std()))
+
+    def job_category_frequency(self):
+        keys, codes = self.job_categories
+        counts = self.np.bincount(codes, minlength=len(keys))
+        return dict(zip(keys, counts.tolist()))
+
+    def mean_by(self, keys, codes):
+        np = self.np
+        counts = np.bincount(codes, minlength=len(keys))
+        totals = np.bincount(codes, weights=self.salaries, minlength=len(keys))
+        return dict(zip(keys, (totals / counts).tolist()))
+
+    def tendency_per_year(self):
+        years, codes = self.np.unique(self.years, return_inverse=True)
+        return self.mean_by(years.tolist(), codes)
+
+    def average_salary_by_country(self):
+        return self.mean_by(*self.countries)
+
+    def average_salary_by_category(self):
+        return self.mean_by(*self.job_categories)
+
+    def lowest_salary(self):
+        return self.salaries.min().item()
+
+    def highest_salary(self):
+        return self.salaries.max().item()
+
+    def salary_quantiles(self, quantiles):
+        return get_array_quantiles(self.np, self.salaries, quantiles)
+
+    def salary_quantiles_by_category(self, quantiles):
+        # salaries sorted within each category, the categories one after the other
+        np = self.np
+        keys, codes = self.job_categories
+        salaries = self.salaries[np.lexsort((self.salaries, codes))]
+        counts = np.bincount(codes, minlength=len(keys)).tolist()
+        starts = np.cumsum([0] + counts[:-1]).tolist()
+        return {
+            key: {
+                name: salaries[start + get_rank_index(quantile, count)].item()
+                for name, quantile in quantiles.items()
+            }
+            for key, start, count in zip(keys, starts, counts)
+        }
+
+    def salary_histogram(self, bins):
+        return get_array_histogram(self.np, self.salaries, bins)
+
+
+class PandasEngine:
+    """
+    Computes the vanilla analysis over a pandas DataFrame, with the text
+    columns stored as categoricals.
+    """
+
+    name = "pandas"
+
+    def __init__(self, salaries, years, job_categories, countries):
+        import numpy as np
+        import pandas as pd
+
+        self.np = np
+
+        self.data = pd.DataFrame(
+            {
+                "salary": pd.Series(salaries, dtype="float64"),
+                "year": pd.Series(years, dtype="int64"),
+                "job_category": pd.Categorical(job_categories),
+                "country": pd.Categorical(countries),
+            }
+        )
+
+    def average_salary(self):
+        return float(self.data["salary"].mean())
+
+    def salary_deviation(self):
+        return float(self.data["salary"].std(ddof=0))
+
+    def years_deviation(self):
+        years = self.data["year"]
+        return float(years.std(ddof=0)), float(years.mean())
+
+    def correlation_salary_years(self):
+        return float(self.data["year"].corr(self.data["salary"]))
+
+    def job_category_frequency(self):
+        # unique() keeps the order of first appearance, value_counts() would not
+        counts = self.data["job_category"].value_counts()
+        return {
+            category: int(counts[category])
+            for category in self.data["job_category"].unique()
+        }
+
+    def mean_by(self, column):
+        means = self.data.groupby(column, observed=True, sort=False)["salary"].mean()
+        return dict(zip(means.index.tolist(), means.tolist()))
+
+    def tendency_per_year(self):
+        return self.mean_by("year")
+
+    def average_salary_by_country(self):
+        return self.mean_by("country")
+
+    def average_salary_by_category(self):
+        return self.mean_by("job_category")
+
+    def lowest_salary(self):
+        return self.data["salary"].min().item()
+
+    def highest_salary(self):
+        return self.data["salary"].max().item()
+
+    def salary_quantiles(self, quantiles):
+        return get_array_quantiles(self.np, self.data["salary"].to_numpy(), quantiles)
+
+    def salary_quantiles_by_category(self, quantiles):
+        groups = self.data.groupby("job_category", observed=True, sort=False)["salary"]
+        return {
+            category: get_array_quantiles(self.np, salaries.to_numpy(), quantiles)
+            for category, salaries in groups
+        }
+
+    def salary_histogram(self, bins):
+        return get_array_histogram(self.np, self.data["salary"].to_numpy(), bins)
+
+
+ENGINES = {
+    "python": PythonEngine,
+    "numpy": NumpyEngine,
+    "pandas": PandasEngine,
+}
+# optional package needed by every engine
+ENGINE_PACKAGES = {"python": None, "numpy": "numpy", "pandas": "pandas"}
+
+
+def get_available_engines():
+    """
+    This function lists the engines whose package is installed
+    """
+    return [
+        name
+        for name, package in ENGINE_PACKAGES.items()
+        if package is None or importlib.util.find_spec(package) is not None
+    ]
+
+
+def select_engine(rows, engine="auto"):
+    """
+    This function returns the engine class to use: the one requested, or with
+    "auto" the fastest available one for the number of rows, i.e. pure Python
+    for small data and NumPy above NUMPY_MIN_ROWS (pandas is never faster
+    for these computations, see the engine timings of benchmark.py)
+    args: rows (int), engine (str) - "auto", "python", "numpy" or "pandas"
+    """
+    if engine == "auto":
+        if rows >= NUMPY_MIN_ROWS and "numpy" in get_available_engines():
+            return NumpyEngine
+        return PythonEngine
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown engine: {engine}. Use auto or one of {', '.join(ENGINES)}."
+        )
+    if engine not in get_available_engines():
+        raise ImportError(
+            f"The {engine} engine needs the {ENGINE_PACKAGES[engine]} package."
+        )
+    return ENGINES[engine]
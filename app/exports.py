@@ -0,0 +1,138 @@
+import importlib.util
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from chunked import ChunkedDataset
+from columnar import save_columns
+from masked import MaskedDataset
+
+# file extension, pandas compression and optional package of every export format
+EXPORT_FORMATS = {
+    "csv": {"extension": "csv", "compression": None, "package": None},
+    "csv.gz": {"extension": "csv.gz", "compression": "gzip", "package": None},
+    "csv.zst": {"extension": "csv.zst", "compression": "zstd", "package": "zstandard"},
+    "parquet": {"extension": "parquet", "compression": None, "package": "pyarrow"},
+    "npy": {"extension": "npy", "compression": None, "package": None},
+}
+# formats that can be written chunk by chunk, i.e. appended to
+APPENDABLE_FORMATS = ["csv", "csv.gz", "csv.zst"]
+MANIFEST_NAME = "manifest.json"
+MISSING_VALUE = "Not Available"
+
+
+def get_export_format(file_format, appendable=False):
+    """
+    This function returns the settings of an export format, checking that
+    it is known and that its optional package is installed
+    args: file_format (str), appendable (bool) - the data is written in chunks
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown export format: {file_format}. Use one of {', '.join(EXPORT_FORMATS)}."
+        )
+    settings = EXPORT_FORMATS[file_format]
+    package = settings["package"]
+    if package and importlib.util.find_spec(package) is None:
+        raise ImportError(f"The {file_format} format needs the {package} package.")
+    if appendable and file_format not in APPENDABLE_FORMATS:
+        raise ValueError(
+            f"The {file_format} format cannot be written chunk by chunk, use {', '.join(APPENDABLE_FORMATS)}."
+        )
+    return settings
+
+
+def get_partition_file(value, settings, used=None):
+    """
+    This function returns the file name of a partition, e.g. "United States_data.csv.gz".
+    Different values can give the same name once cleaned (e.g. "A/B" and "A_B"),
+    so a name already in `used` gets a number, e.g. "A_B_2_data.csv". Names are
+    compared case-insensitively, like the file systems of Windows and macOS do
+    args: value (object), settings (dict), used (set | None) - lowercase names already taken, updated
+    """
+    name = re.sub(r"[^\w\- .]", "_", str(value)).strip() or "_"
+    file_name = f"{name}_data.{settings['extension']}"
+    if used is None:
+        return file_name
+    number = 1
+    while file_name.lower() in used:
+        number += 1
+        file_name = f"{name}_{number}_data.{settings['extension']}"
+    used.add(file_name.lower())
+    return file_name
+
+
+def iter_frames(data):
+    """
+    This function yields the active rows of a dataset: the whole frame at once,
+    or one chunk at a time for a ChunkedDataset
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+    if isinstance(data, ChunkedDataset):
+        yield from data.iter_chunks()
+    elif isinstance(data, MaskedDataset):
+        yield data.base if data.mask is None else data.select(data.mask)
+    else:
+        yield data
+
+
+def write_partition(rows, path, file_format, settings, append=False):
+    if file_format == "npy":
+        save_columns(rows, path)
+    elif file_format == "parquet":
+        rows.to_parquet(path, index=False)
+    else:
+        rows.to_csv(
+            path,
+            index=False,
+            header=not append,
+            mode="a" if append else "w",
+            compression=settings["compression"],
+        )
+
+
+def export_partitions(data, folder, by="Country", file_format="csv", workers=None):
+    """
+    This function writes one file per value of the `by` column, e.g. one file
+    per country, going over the data a single time. Partitions are written by
+    a pool of threads, chunk after chunk for a ChunkedDataset.
+    A manifest.json with the file and row count of every partition is written last.
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), folder (str), by (str), file_format (str), workers (int | None) - os.cpu_count() by default
+    """
+    settings = get_export_format(file_format, isinstance(data, ChunkedDataset))
+    os.makedirs(folder, exist_ok=True)
+    partitions = {}
+    used_files = set()
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        for frame in iter_frames(data):
+            writes = []
+            groups = frame.groupby(by, observed=True, dropna=False, sort=False)
+            for value, rows in groups:
+                if value != value:  # NaN
+                    value = MISSING_VALUE
+                value = value.item() if hasattr(value, "item") else value
+                append = value in partitions
+                if not append:
+                    file_name = get_partition_file(value, settings, used_files)
+                    partitions[value] = {"value": value, "file": file_name, "rows": 0}
+                partitions[value]["rows"] += len(rows)
+                path = os.path.join(folder, partitions[value]["file"])
+                writes.append(
+                    executor.submit(
+                        write_partition, rows, path, file_format, settings, append
+                    )
+                )
+            # every file of this chunk is complete before the next chunk appends to it
+            for write in writes:
+                write.result()
+
+    manifest = {
+        "by": by,
+        "format": file_format,
+        "rows": sum(partition["rows"] for partition in partitions.values()),
+        "partitions": sorted(partitions.values(), key=lambda item: str(item["value"])),
+    }
+    with open(os.path.join(folder, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
@@ -1,18 +1,60 @@
+import copy
 import csv
+import io
 import locale
+import mmap
 import os
-import requests
+import re
+import weakref
 
 import pandas as pd
 from tabulate import tabulate
-from forex_python.converter import CurrencyRates
+
+from chunked import ChunkedDataset
+from classes import (
+    ExchangeRateCache,
+    ResultCache,
+    StreamingPythonAnalysis,
+    VanillaPythonAnalysis,
+)
+from correlation import (
+    CORRELATION_COLUMNS,
+    CORRELATION_GROUPS,
+    accumulate_covariance,
+)
+from columnar import (
+    COLUMN_NAMES,
+    REMOVED_COLUMNS,
+    concat_frames,
+    get_cached_size,
+    load_frame,
+    load_python_columns,
+)
+from exports import EXPORT_FORMATS, export_partitions, iter_frames
+from indexes import AggregateCube, CountryIndex
+from ingest import TailReader
+from masked import MaskedDataset
+from menu import get_user_input
+from parallel import aggregate_csv
+from plans import QueryPlan
+from profiling import profile_functions, profiler
+from rendering import PAGE_SIZE, TablePager, format_currency_column
+from sketches import DEFAULT_QUANTILES, SalarySketches
 
 locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
-c = CurrencyRates()
 
 current_dir = os.path.dirname(__file__)
 parent_dir = os.path.dirname(current_dir)
 file_path = os.path.join(parent_dir, "dataset", "jobs_in_data.csv")
+rates_path = os.path.join(parent_dir, "dataset", "exchange_rates.json")
+
+OUTLIER_GROUPS = ["Country", "Job category", "Experience level"]
+COUNT_CHUNK_SIZE = 16 * 1024 * 1024
+BLANK_LINE = re.compile(rb"\n(?=\r?\n)")
+line_count_cache = {}  # (path, size, mtime) -> (lines, records)
+result_cache = ResultCache()
+currency_client = None  # forex-python client, created on first use
+MAD_SCALE = 0.6745  # makes the MAD comparable to the standard deviation for normal data
 
 
 def get_total_lines(data, removed=False):
@@ -23,21 +65,20 @@ def get_total_lines(data, removed=False):
     """
 
     if not removed:
-        # using the built-in file reading function to read the data
-        data_file = get_data_file()
-        total_lines = len(data_file)
+        try:
+            total_lines, total_records = count_file_lines()
+        except OSError as e:
+            print(f"Error: {e}")
+            return
 
         print("\n************")
         print(
-            f"Total number of lines: {total_lines} using file reading function - this method counts the header as a line"
+            f"Total number of lines: {total_lines} using a memory-mapped line count - this method counts the header as a line"
         )
-
-        # using the built-in csv library to read the data
-        data_list = get_data_csv()
-        total_lines = len(data_list)
-
         print("************")
-        print(f"Total number of lines: {total_lines} using CSV library")
+        print(
+            f"Total number of lines: {total_records} counting records as the CSV library does"
+        )
         print("************")
 
     else:
@@ -49,13 +90,17 @@ def get_total_lines(data, removed=False):
         print("************")
 
 
-def get_data_pd():
+def get_data_pd(columns=None, compact=False):
     """
     This function reads the data from the jobs_in_data.csv file
-    and returns it as a DataFrame
+    and returns it as a DataFrame. The columnar cache is used when it is
+    up to date with the csv file, otherwise it is rebuilt first.
+    columns limits what is loaded and compact uses categoricals and small
+    integer types (e.g. get_data_pd(list(COLUMN_NAMES), compact=True) for the menu)
+    args: columns (list | None), compact (bool)
     """
     try:
-        data = pd.read_csv(file_path)
+        data = load_frame(file_path, columns, compact)
     except FileNotFoundError:
         print("File not found.")
         return None
@@ -66,6 +111,7 @@ def get_data_pd():
         return data
 
 
+@profiler.phase("parse")
 def get_data_file():
     """
     This function reads the data from the
@@ -84,6 +130,7 @@ def get_data_file():
         return data
 
 
+@profiler.phase("parse")
 def get_data_csv():
     """
     This function reads the data from the jobs_in_data.csv
@@ -102,34 +149,94 @@ def get_data_csv():
         return data
 
 
+def count_file_lines(path=None):
+    """
+    This function counts the lines and the csv records of a file
+    without parsing it. The file is memory-mapped and scanned in large chunks,
+    and the result is cached until the file size or modification time changes.
+    Returns (lines, records): lines matches len(file.readlines()) and records
+    matches len(list(csv.DictReader(file))) for RFC 4180 quoting.
+    args: path (str) - the dataset file by default
+    """
+    if path is None:
+        path = file_path
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key in line_count_cache:
+        return line_count_cache[key]
+
+    lines = records = 0
+    if stat.st_size:
+        in_quotes = False
+        pending = False  # the current record already has some content
+        last_byte = b""
+        with open(path, "rb") as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            # a leading blank line is taken as an (empty) header by the csv library
+            header_is_blank = mapped[:1] in (b"\n", b"\r")
+            for start in range(0, stat.st_size, COUNT_CHUNK_SIZE):
+                chunk = mapped[start : start + COUNT_CHUNK_SIZE]
+                lines += chunk.count(b"\n")
+                last_byte = chunk[-1:]
+                for position, segment in enumerate(chunk.split(b'"')):
+                    if position:
+                        in_quotes = not in_quotes
+                        pending = True
+                    if in_quotes:
+                        continue
+                    ended, pending = count_segment_records(segment, pending)
+                    records += ended
+        if pending:
+            records += 1
+        if last_byte != b"\n":
+            lines += 1
+        if records and not header_is_blank:
+            records -= 1  # the header is not a record
+
+    line_count_cache[key] = (lines, records)
+    return lines, records
+
+
+def count_segment_records(segment, pending):
+    """
+    This function counts how many non-blank records end inside an unquoted
+    piece of a csv file, as blank lines are skipped by the csv library.
+    Returns the number of records and whether the last one is still open.
+    args: segment (bytes), pending (bool)
+    """
+    newlines = segment.count(b"\n")
+    if not newlines:
+        return 0, pending or bool(segment.strip(b"\r"))
+
+    ended = newlines
+    if not pending and not segment[: segment.index(b"\n")].strip(b"\r"):
+        ended -= 1
+    if b"\n\n" in segment or b"\n\r\n" in segment:
+        ended -= len(BLANK_LINE.findall(segment))
+    return ended, bool(segment[segment.rindex(b"\n") + 1 :].strip(b"\r"))
+
+
 def treat_axis(data):
     """
     This function is responsible for making the data more readable
-    by renaming and removing some columns from the dataset
+    by renaming and removing some columns from the dataset.
+    Columns that were not loaded in the first place are simply not dropped.
+    The kept columns are not copied, so a frame loaded from the columnar
+    cache stays memory-mapped
     args: data (DataFrame)
     """
-    new_data = data.copy()
     try:
-        remove_cols = [
-            "work_year",
-            "job_title",
-            "salary_currency",
-            "salary",
-            "company_size",
-        ]
-        new_data.drop(columns=remove_cols, inplace=True)
-
-        new_data.rename(
-            columns={
-                "job_category": "Job category",
-                "employee_residence": "Country",
-                "experience_level": "Experience level",
-                "employment_type": "Employment type",
-                "work_setting": "Work setting",
-                "company_location": "Company location",
-                "salary_in_usd": "Salary in USD",
+        missing = [column for column in COLUMN_NAMES if column not in data.columns]
+        if missing:
+            raise KeyError(missing)
+        new_data = pd.DataFrame(
+            {
+                COLUMN_NAMES.get(column, column): data[column]
+                for column in data.columns
+                if column not in REMOVED_COLUMNS
             },
-            inplace=True,
+            copy=False,
         )
     except:
         print("Failed to treat the data.")
@@ -138,46 +245,156 @@ def treat_axis(data):
         return new_data
 
 
-def get_user_input():
+def cached_result(data, name, compute):
+    """
+    This function returns a memoized result for the given DataFrame.
+    Results are dropped from use as soon as the dataset generation changes,
+    which happens when the outliers are removed or restored.
+    Entries keep a weak reference to their dataset, as the id of a dataset
+    that was garbage collected can be given to a new one
+    args: data (DataFrame), name (hashable), compute (callable)
+    """
+    key = (id(data), name)
+    owner, value = result_cache.get_or_compute(
+        key, lambda: (weakref.ref(data), compute())
+    )
+    if owner() is not data:
+        # the id belonged to a dataset that was garbage collected since
+        result_cache.discard(key)
+        owner, value = result_cache.get_or_compute(
+            key, lambda: (weakref.ref(data), compute())
+        )
+    return value
+
+
+def get_cached_result(data, name):
     """
-    This function gets the user input for a specific action
+    This function returns a memoized result of the given dataset
+    if it was already computed, else None
+    args: data (DataFrame), name (hashable)
     """
-    options_for_the_user = [
-        "1. Check the total number of lines in the file",
-        "2. Check the global average salary in USD",
-        "3. Check the average salary by country",
-        "4. Type a country to see all available data",
-        "5. Filter data by job category and country",
-        "6. Type a country to see a summary of the data",
-        "7. Detect outliers using Z-score method",
-        "8. Check some general insights from the data",
-        "9. Restore the original data with the outliers",
-        "0. Exit program",
-    ]
-    options = "\n".join(options_for_the_user)
-    user_action = input(
-        f"What would you like to do? Type the corresponding number: \n\n{options}\n"
-    ).strip()
+    entry = result_cache.get((id(data), name))
+    if entry is None or entry[0]() is not data:
+        return None
+    return entry[1]
+
+
+def get_vanilla_analysis(from_csv=False, workers=1, engine=None):
+    """
+    This function returns the streaming analysis of the csv file.
+    It is built once, then the rows appended to the file since are folded
+    into its running statistics, parsing only those rows.
+    from_csv reads the csv row by row instead of the columnar cache,
+    for files that do not fit in memory, and workers > 1 splits that
+    reading across processes.
+    engine keeps the cached columns in memory and computes the statistics
+    with a compute engine ("auto", "python", "numpy" or "pandas") instead
+    args: from_csv (bool), workers (int), engine (str | None)
+    """
+    if workers > 1:
+        key = "vanilla_analysis_parallel"
+
+        def build():
+            tail_reader = TailReader(file_path)
+            stats = aggregate_csv(file_path, workers, tail_reader.offset)
+            return StreamingPythonAnalysis(stats=stats, tail=tail_reader)
+
+    elif from_csv:
+        key = "vanilla_analysis_csv"
+
+        def build():
+            return StreamingPythonAnalysis(file_path)
+
+    elif engine is not None:
+        key = ("vanilla_analysis_engine", engine)
+
+        def build():
+            columns = load_python_columns(
+                file_path,
+                ["salary_in_usd", "work_year", "job_category", "employee_residence"],
+            )
+            return VanillaPythonAnalysis(
+                columns=columns, tail=get_tail_reader(file_path), engine=engine
+            )
+
+    else:
+        key = "vanilla_analysis"
+
+        def build():
+            columns = load_python_columns(
+                file_path,
+                ["salary_in_usd", "work_year", "job_category", "employee_residence"],
+            )
+            return StreamingPythonAnalysis(
+                columns=columns, tail=get_tail_reader(file_path)
+            )
+
+    analysis = result_cache.get_or_compute(key, build, versioned=False)
     try:
-        action = int(user_action)
-    except ValueError:
-        print("Invalid choice.")
-        return get_user_input()
+        analysis.update()
+    except ValueError:  # the file was rewritten, not appended to
+        result_cache.discard(key, versioned=False)
+        analysis = result_cache.get_or_compute(key, build, versioned=False)
+    return analysis
+
+
+def get_tail_reader(path=None):
+    """
+    This function returns a TailReader starting where the columnar cache
+    of the csv file ends, i.e. after the rows get_data_pd has loaded
+    args: path (str | None) - the dataset by default
+    """
+    path = path or file_path
+    return TailReader(path, get_cached_size(path))
+
+
+def ingest_appended_rows(data, tail_reader):
+    """
+    This function folds the rows appended to the csv file since the last read
+    into the dataset. Only the new bytes are parsed, and the aggregate cube of
+    the new rows is merged into the existing one instead of being rebuilt.
+    Returns the updated dataset and the number of new rows.
+    Raises ValueError if the file was rewritten instead of appended to
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), tail_reader (TailReader)
+    """
+    tail = tail_reader.read_tail()
+    if not tail:
+        return data, 0
+    rows = pd.read_csv(
+        io.BytesIO(tail_reader.header + tail), usecols=list(COLUMN_NAMES)
+    )
+    rows = rows.rename(columns=COLUMN_NAMES)
+    if isinstance(data, ChunkedDataset):
+        return data.reload(), len(rows)
+
+    cube = get_aggregate_cube(data)
+    if isinstance(data, MaskedDataset):
+        extended = data.extend(rows)
     else:
-        if action in range(0, len(options_for_the_user)):
-            return action
-        else:
-            print("Invalid choice.")
-            return get_user_input()
+        extended = concat_frames(data, rows)
+    cached_result(
+        extended,
+        "aggregate_cube",
+        lambda: AggregateCube.merge([cube, AggregateCube(rows)]),
+    )
+    # the salary sketches are only merged if they were built, else they are built on first use
+    sketches = get_cached_result(data, "salary_sketches")
+    if sketches is not None:
+        cached_result(
+            extended,
+            "salary_sketches",
+            lambda: copy.deepcopy(sketches).merge(SalarySketches().update(rows)),
+        )
+    return extended, len(rows)
 
 
 def get_average_salary(data):
     """
     This function calculates the average salary in USD
-    args: data (DataFrame)
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
     """
     try:
-        average_salary = data["Salary in USD"].mean()
+        average_salary = query(data).aggregate(mean="mean").collect()["mean"].iloc[0]
     except KeyError:
         print("Data not found.")
     else:
@@ -185,54 +402,52 @@ def get_average_salary(data):
         print(f"\nThe average salary in USD is: {formatted_salary} per year.")
 
 
-def get_average_salary_by_country(data):
+def get_average_salary_by_country(data, page_size=PAGE_SIZE):
     """
     This function calculates the average salary by country
     and the percentage variation compared to the global mean salary
-    args: data (DataFrame)
+    args: data (DataFrame), page_size (int)
     """
     try:
-        overall_mean_salary = data["Salary in USD"].mean()
-        average_salary_by_country = data.groupby("Country")["Salary in USD"].mean()
+        overall_mean_salary = (
+            query(data).aggregate(mean="mean").collect()["mean"].iloc[0]
+        )
+        plan = (
+            query(data)
+            .group_by("Country")
+            .aggregate(**{"Average Salary": "mean"})
+            .with_column(
+                "Variation from global mean(%)",
+                lambda rows: (rows["Average Salary"] - overall_mean_salary)
+                / overall_mean_salary
+                * 100,
+            )
+            # formatting page by page prevents issues with other calculations
+            .format("Average Salary", format_currency_column)
+            .format(
+                "Variation from global mean(%)",
+                lambda column: column.map("{:.2f}".format),
+            )
+        )
+        table = cached_result(data, plan.key, plan.collect)
     except KeyError:
         print("Data not found.")
     else:
-        formatted_data = []
-        for country, salary in average_salary_by_country.items():
-            variation_in_percentage = (
-                (salary - overall_mean_salary) / overall_mean_salary
-            ) * 100
-            formatted_salary = format_currency(
-                salary
-            )  # formattig 'on the fly' prevents issues with other calculations
-            formatted_data.append(
-                {
-                    "Country": country,
-                    "Average Salary": formatted_salary,
-                    "Variation from global mean(%)": f"{variation_in_percentage:.2f}",
-                }
-            )
-        print(tabulate(formatted_data, headers="keys", tablefmt="pretty"))
+        plan.pager(page_size, table, showindex=False).browse()
 
 
-def group_by_job_category(data):
+def group_by_job_category(data, page_size=PAGE_SIZE):
     """
     This function groups the data by job category
-    args: data (DataFrame)
+    args: data (DataFrame), page_size (int)
     """
     try:
-        grouped_data = (
-            data.groupby(["Country", "Job category"])["Salary in USD"]
-            .mean()
-            .reset_index()
-        )
+        plan = get_job_categories_plan(data)
+        grouped_data = cached_result(data, plan.key, plan.collect)
     except:
         print("Failed to group the data.")
     else:
-        grouped_data["Salary in USD"] = grouped_data["Salary in USD"].apply(
-            format_currency
-        )
-        print(tabulate(grouped_data, headers="keys", tablefmt="pretty"))
+        plan.pager(page_size, grouped_data).browse()
         filter_country = (
             input(
                 "\nIf you want to isolate one country, specify it. Else press Enter to continue.\n"
@@ -241,20 +456,105 @@ def group_by_job_category(data):
             .strip()
         )
         if filter_country:
-            filtered_data = grouped_data.loc[grouped_data["Country"] == filter_country]
+            # the country filter is applied to the aggregate cube, before the roll-up
+            filtered_plan = get_job_categories_plan(data, filter_country)
+            filtered_data = filtered_plan.collect()
             if filtered_data.empty:
                 print("Country not found.")
             else:
-                print(tabulate(filtered_data, headers="keys", tablefmt="pretty"))
+                filtered_plan.pager(page_size, filtered_data).browse()
+
+
+def get_job_categories_plan(data, country=None):
+    """
+    This function returns the query plan of the average salary per country
+    and job category, of a single country if one is given.
+    Salaries are formatted as currency when they are displayed
+    args: data (DataFrame), country (str | None)
+    """
+    plan = query(data)
+    if country:
+        plan = plan.filter("Country", country)
+    return (
+        plan.group_by("Country", "Job category")
+        .aggregate(**{"Salary in USD": "mean"})
+        .format("Salary in USD", format_currency_column)
+    )
+
+
+def query(data):
+    """
+    This function starts a lazy query plan over a dataset, answered from its
+    cached aggregate cube and country index whenever possible
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+    return QueryPlan(
+        data, lambda: get_aggregate_cube(data), lambda: get_country_index(data)
+    )
 
 
-def get_country_info(data, country):
+def get_aggregate_cube(data):
     """
-    This function gets the information of a specific country
+    This function returns the aggregate cube of a DataFrame,
+    built once per dataset generation
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+    if isinstance(data, ChunkedDataset):
+        return data.cube
+    if isinstance(data, MaskedDataset):
+        return cached_result(
+            data, "aggregate_cube", lambda: AggregateCube(data.base, mask=data.mask)
+        )
+    return cached_result(data, "aggregate_cube", lambda: AggregateCube(data))
+
+
+def get_salary_sketches(data):
+    """
+    This function returns the salary quantile sketches of a dataset, overall
+    and per country and job category, built in one pass over its rows
+    (chunk after chunk for a ChunkedDataset) once per dataset generation
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+
+    def build():
+        sketches = SalarySketches()
+        for frame in iter_frames(data):
+            sketches.update(frame)
+        return sketches
+
+    return cached_result(data, "salary_sketches", build)
+
+
+def get_country_index(data):
+    """
+    This function returns the country index of a DataFrame,
+    built once per dataset generation
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+    if isinstance(data, (ChunkedDataset, MaskedDataset)):
+        return data.country_index
+    return cached_result(data, "country_index", lambda: CountryIndex(data))
+
+
+def get_country_rows(data, country):
+    """
+    This function returns the rows of a country (case and whitespace insensitive)
+    as a new DataFrame, without scanning the whole dataset
     args: data (DataFrame), country (str)
     """
+    return get_country_index(data).lookup(data, country)
+
+
+def get_country_info(data, country, page_size=PAGE_SIZE):
+    """
+    This function gets the information of a specific country.
+    Rows are shown one page at a time and salaries are only formatted
+    for display, so the returned rows keep their numeric values
+    args: data (DataFrame), country (str), page_size (int)
+    """
+    plan = query(data).filter("Country", country)
     try:
-        country_info = data[data["Country"] == country].copy()
+        country_info = plan.collect()
     except KeyError:
         print("Country not found.")
         return None
@@ -263,11 +563,9 @@ def get_country_info(data, country):
             print(f"No data found for {country}.")
             return None
 
-        # Format the salary as currency
-        country_info["Salary in USD"] = country_info["Salary in USD"].apply(
-            format_currency
-        )
-        print(tabulate(country_info, headers="keys", tablefmt="pretty"))
+        plan.format("Salary in USD", format_currency_column).pager(
+            page_size, country_info
+        ).browse()
         return country_info
 
 
@@ -286,6 +584,63 @@ def export_country_data(data, download_data, country):
             print(f"{country}_data.csv file created.")
 
 
+def export_all_data(data, file_format="csv", folder="exports", by="Country"):
+    """
+    This function exports the data of every country (or of every value of
+    the `by` column) in a single pass, one file per country plus a manifest
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), file_format (str), folder (str), by (str)
+    """
+    try:
+        manifest = export_partitions(data, folder, by, file_format or "csv")
+    except (ValueError, ImportError) as error:
+        print(error)
+        return None
+    except:
+        print("Failed to export the data.")
+        return None
+    else:
+        print(
+            f"{len(manifest['partitions'])} files with {manifest['rows']} rows created in the {folder} folder."
+        )
+        return manifest
+
+
+def get_country_stats(data, country):
+    """
+    This function gets the summary statistics of a specific country from the
+    aggregate cube and the salary sketches, or None if there is no data for the country
+    args: data (DataFrame), country (str)
+    """
+    name = get_country_index(data).get_name(country)
+    if name is None:
+        return None
+    plan = query(data).filter("Country", name)
+    totals = (
+        plan.aggregate(count="count", mean="mean", std="std", min="min", max="max")
+        .collect()
+        .iloc[0]
+    )
+    # ties go to the first name in alphabetical order, as with Series.mode
+    jobs = plan.group_by("Job category").aggregate(count="count").collect()
+    employment_types = (
+        plan.group_by("Employment type").aggregate(count="count").collect()
+    )
+    quantiles = get_salary_sketches(data).get("Country", name).quantiles()
+    return {
+        "country": name,
+        "responses": int(totals["count"]),
+        "average_salary": totals["mean"],
+        "std_salary": totals["std"],
+        "highest_salary": totals["max"],
+        "lowest_salary": totals["min"],
+        **{f"{quantile}_salary": quantiles[quantile] for quantile in DEFAULT_QUANTILES},
+        "most_common_job": jobs.loc[jobs["count"].idxmax(), "Job category"],
+        "most_common_employment_type": employment_types.loc[
+            employment_types["count"].idxmax(), "Employment type"
+        ],
+    }
+
+
 def get_country_summary(data, country, currency="USD"):
     """
     This function gets the summary of a specific country.
@@ -294,33 +649,33 @@ def get_country_summary(data, country, currency="USD"):
     args: data (DataFrame), country (str), currency (str)
     """
     try:
-        country_info = data[
-            data["Country"] == country
-        ].copy()  # using the copy method in case the user wants to convert the currency (keeping the original data intact)
+        stats = get_country_stats(data, country)
     except KeyError:
         print("Country not found.")
     else:
-        if country_info.empty:
+        if stats is None:
             print(f"No data found for {country}.")
+            return
+        country = stats["country"]
+        rate = 1.0
         if currency != "USD":
             try:
-                country_info["Salary in USD"] = country_info["Salary in USD"].apply(
-                    lambda s: c.convert("USD", currency, s)
-                )
-            except:
-                try:
-                    country_info["Salary in USD"] = country_info["Salary in USD"].apply(
-                        lambda x: convert_currency("USD", currency, x)
-                    )  # plan B in case python-forex is not working, it goes offline sometimes
-                except:
-                    print("Error converting currency")
-
-        average_salary = country_info["Salary in USD"].mean()
-        number_of_responses = country_info.shape[0]
-        most_common_job = country_info["Job category"].mode().values[0]
-        highest_salary = country_info["Salary in USD"].max()
-        lowest_salary = country_info["Salary in USD"].min()
-        most_common_emp_type = country_info["Employment type"].mode().values[0]
+                rate = rate_provider.get_rate("USD", currency)
+            except LookupError:
+                print("Error converting currency")
+                currency = "USD"
+
+        # the rate is positive, so converting the aggregates is the same as converting every salary
+        average_salary = stats["average_salary"] * rate
+        number_of_responses = stats["responses"]
+        most_common_job = stats["most_common_job"]
+        highest_salary = stats["highest_salary"] * rate
+        lowest_salary = stats["lowest_salary"] * rate
+        most_common_emp_type = stats["most_common_employment_type"]
+        median_salary = stats["median_salary"] * rate
+        p10_salary = stats["p10_salary"] * rate
+        p90_salary = stats["p90_salary"] * rate
+        p99_salary = stats["p99_salary"] * rate
 
         summary = {
             "Country": country,
@@ -329,9 +684,13 @@ def get_country_summary(data, country, currency="USD"):
             "Most Common Job": most_common_job,
             "Highest Salary": format_currency(highest_salary, currency),
             "Lowest Salary": format_currency(lowest_salary, currency),
+            "Median Salary": format_currency(median_salary, currency),
+            "10th - 90th Percentile": f"{format_currency(p10_salary, currency)} - {format_currency(p90_salary, currency)}",
+            "99th Percentile": format_currency(p99_salary, currency),
             "Most Common Employment Type": most_common_emp_type,
         }
-        print(tabulate([summary], headers="keys", tablefmt="pretty"))
+        with profiler.phase("render"):
+            print(tabulate([summary], headers="keys", tablefmt="pretty"))
 
         other_currency = (
             input(
@@ -344,15 +703,145 @@ def get_country_summary(data, country, currency="USD"):
             get_country_summary(data, country, other_currency)
 
 
+def get_correlation_frames(data):
+    """
+    This function yields the active rows of a dataset with the csv names of the
+    correlation columns. The menu datasets leave out the work year and the
+    company size: a ChunkedDataset reads them along with its chunks, in the
+    same pass over the csv file, and the in-memory datasets take them from the
+    columnar cache by row position (their index is the row number in the csv file)
+    args: data (DataFrame | MaskedDataset | ChunkedDataset)
+    """
+    csv_names = {name: column for column, name in COLUMN_NAMES.items()}
+    extra_columns = [
+        column
+        for column in dict.fromkeys(CORRELATION_COLUMNS + CORRELATION_GROUPS)
+        if column not in COLUMN_NAMES
+    ]
+    if isinstance(data, ChunkedDataset):
+        for chunk in data.iter_chunks(extra_columns):
+            yield chunk.rename(columns=csv_names)
+        return
+    extra = load_frame(file_path, extra_columns, compact=True)
+    for frame in iter_frames(data):
+        rows = frame.rename(columns=csv_names)
+        positions = rows.index.to_numpy()
+        yield rows.assign(
+            **{column: extra[column].to_numpy()[positions] for column in extra_columns}
+        )
+
+
+def get_correlations(data, group_by=None):
+    """
+    This function returns the covariance accumulator of the salary, the work
+    year and the encoded experience level, company size, work setting and
+    employment type over the active rows of a dataset (e.g. without the
+    outliers), and with group_by one accumulator per value of that column.
+    It is built in one blocked pass (one chunk at a time for a ChunkedDataset),
+    once per dataset
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), group_by (str | None)
+    """
+    if group_by is not None and group_by not in CORRELATION_GROUPS:
+        raise ValueError(
+            f"Unknown group: {group_by}. Use one of {', '.join(CORRELATION_GROUPS)}."
+        )
+    return cached_result(
+        data,
+        ("correlations", group_by),
+        lambda: accumulate_covariance(get_correlation_frames(data), group_by),
+    )
+
+
+def get_correlation_report(data, group_by=None, page_size=PAGE_SIZE):
+    """
+    This function prints the correlation matrix of the salary and the encoded
+    dimensions, then with group_by the correlation of the salary with each
+    dimension per group, one page at a time
+    args: data (DataFrame), group_by (str | None), page_size (int)
+    """
+    try:
+        total, groups = get_correlations(data, group_by)
+    except ValueError as error:
+        print(error)
+        return None
+
+    matrix = total.correlation()
+    labels = [name.split("=")[-1] for name in matrix.columns]
+    with profiler.phase("render"):
+        print(f"Correlations over {total.count} responses:\n")
+        print(
+            tabulate(
+                matrix.round(2).set_axis(labels, axis=1),
+                headers="keys",
+                tablefmt="pretty",
+            )
+        )
+    print(
+        "\nExperience level and company size are ordered from lowest to highest,"
+        " work settings and employment types are 1 for the rows that have them."
+    )
+    if not groups:
+        return matrix
+
+    by_group = pd.DataFrame(
+        {
+            key: accumulator.correlation()["salary_in_usd"]
+            for key, accumulator in groups.items()
+        }
+    ).T.drop(columns="salary_in_usd")
+    by_group.columns = labels[1:]
+    by_group.insert(
+        0, "Responses", [accumulator.count for accumulator in groups.values()]
+    )
+    by_group = by_group.sort_values("Responses", ascending=False).round(2)
+    print(f"\nCorrelation of the salary with every dimension, per {group_by}:\n")
+    TablePager(by_group.rename_axis(group_by).reset_index(), page_size).browse()
+    return matrix
+
+
+def fetch_rates_forex(base):
+    """
+    This function gets the exchange rate table using the forex-python library
+    args: base (str)
+    """
+    return get_currency_client().get_rates(base)
+
+
+def get_currency_client():
+    """
+    This function returns the forex-python client.
+    It is imported and created on first use, as importing it slows the startup down
+    """
+    global currency_client
+    if currency_client is None:
+        from forex_python.converter import CurrencyRates
+
+        currency_client = CurrencyRates()
+    return currency_client
+
+
+def fetch_rates_api(base):
+    """
+    This function gets the exchange rate table from the Exchange Rate API.
+    It is the plan B in case python-forex is not working, it goes offline sometimes
+    args: base (str)
+    """
+    import requests  # only needed when the rates are not cached
+
+    url = "https://api.exchangerate-api.com/v4/latest/" + base
+    api_response = requests.get(url, timeout=10)
+    return api_response.json()["rates"]
+
+
+rate_provider = ExchangeRateCache(rates_path, [fetch_rates_forex, fetch_rates_api])
+
+
 def convert_currency(base, target, amount):
     """
-    This function converts the currency using the forex-python library
+    This function converts the currency using the cached exchange rates
     args: base (str), target (str), amount (float)
     """
-    url = "https://api.exchangerate-api.com/v4/latest/" + base
-    api_response = requests.get(url)
-    data = api_response.json()
-    return amount * data["rates"][target]
+    return amount * rate_provider.get_rate(base, target)
 
 
 def format_currency(amount, currency="USD"):
@@ -366,38 +855,96 @@ def format_currency(amount, currency="USD"):
         return "{:,.2f} {}".format(amount, currency)
 
 
-def detect_outliers(data, threshold=3):
+def get_outlier_mask(data, threshold=3, group_by=None, method="zscore"):
+    """
+    This function scores every salary at once and returns a boolean mask
+    flagging the outliers. Statistics are computed a single time (per group
+    when group_by is given) instead of once per row.
+    method="zscore" uses mean/std, method="mad" uses the robust modified
+    Z-score based on the median and the median absolute deviation.
+    For a MaskedDataset the mask covers the base frame and only active rows are scored.
+    For a ChunkedDataset, a row filter applied chunk by chunk is returned instead.
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), threshold (float), group_by (str | list | None), method (str)
+    """
+    if isinstance(data, ChunkedDataset):
+        return data.get_outlier_filter(threshold, group_by, method)
+
+    if isinstance(data, MaskedDataset):
+        salaries = data.get_salaries()  # inactive rows are NaN and never flagged
+        data = data.base
+    else:
+        salaries = data["Salary in USD"]
+    if group_by is None:
+        groups = None
+    else:
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        unknown = [col for col in group_by if col not in OUTLIER_GROUPS]
+        if unknown:
+            raise ValueError(f"Cannot group outliers by {', '.join(unknown)}.")
+        groups = salaries.groupby([data[col] for col in group_by], observed=True)
+
+    if method == "zscore":
+        if groups is None:
+            center, spread = salaries.mean(), salaries.std()
+        else:
+            center, spread = groups.transform("mean"), groups.transform("std")
+        z_scores = (salaries - center) / spread
+    elif method == "mad":
+        if groups is None:
+            center = salaries.median()
+            spread = (salaries - center).abs().median()
+        else:
+            center = groups.transform("median")
+            abs_deviation = (salaries - center).abs()
+            spread = abs_deviation.groupby(
+                [data[col] for col in group_by], observed=True
+            ).transform("median")
+        z_scores = MAD_SCALE * (salaries - center) / spread
+    else:
+        raise ValueError(f"Unknown outlier method: {method}.")
+
+    # groups with a single row or no spread produce NaN/inf scores, never outliers
+    return z_scores.abs().replace(float("inf"), float("nan")) > threshold
+
+
+def detect_outliers(
+    data, threshold=3, group_by=None, method="zscore", page_size=PAGE_SIZE
+):
     """
     This function checks for outliers in the data using Z-score method.
     The threshold is set to 3 by default as per 'empirical rule':
     https://en.wikipedia.org/wiki/68%E2%80%9395%E2%80%9399.7_rule for more info
-    args: data (DataFrame), threshold (int)
+    Returns the user's answer and a boolean mask of the outlier rows.
+    args: data (DataFrame), threshold (int), group_by (str | list | None), method (str), page_size (int)
     """
     try:
-        z_scores = data["Salary in USD"].apply(
-            lambda x: (x - data["Salary in USD"].mean()) / data["Salary in USD"].std()
-        )
-        outliers = data[abs(z_scores) > threshold].copy()
-        outliers["Salary in USD"] = outliers["Salary in USD"].apply(format_currency)
+        outliers_mask = get_outlier_mask(data, threshold, group_by, method)
+        if isinstance(data, (ChunkedDataset, MaskedDataset)):
+            outliers = data.select(outliers_mask)
+        else:
+            outliers = data[outliers_mask]
     except:
         print("Failed to check for outliers.")
         return None, None
     else:
-        print(tabulate(outliers, headers="keys", tablefmt="pretty"))
+        TablePager(
+            outliers, page_size, {"Salary in USD": format_currency_column}
+        ).browse()
         print(f"\nTotal number of outliers: {outliers.shape[0]}\n")
         if outliers.empty:
             print("No outliers found.")
             return None, None
         else:
             print(f"Do you want to remove the outliers from the dataset?")
-            return (input("Type 'yes' or 'no': ").lower().strip(), outliers)
+            return (input("Type 'yes' or 'no': ").lower().strip(), outliers_mask)
 
 
 def remove_outliers(rmv_outliers, data, outliers=None, removed=False):
     """
     This function removes the outliers from the dataset
     as per the user's request
-    args: rmv_outliers (str), data (DataFrame), outliers (DataFrame), removed (bool)
+    args: rmv_outliers (str), data (DataFrame | MaskedDataset | ChunkedDataset), outliers (boolean Series | row filter), removed (bool)
     """
     if rmv_outliers in [
         "yes",
@@ -411,7 +958,11 @@ def remove_outliers(rmv_outliers, data, outliers=None, removed=False):
             "\nAre you sure you want to remove the outliers from the dataset? Type 'yes' or 'no': "
         )
         if confirmation.lower().strip() in ["yes", "y", "yeah", "yep", "sure", "ok"]:
-            filtered_data = data[~data.index.isin(outliers.index)]
+            if isinstance(data, (ChunkedDataset, MaskedDataset)):
+                filtered_data = data.without(outliers)
+            else:
+                filtered_data = data[~outliers]
+            result_cache.bump()
             print("\nOutliers removed.")
             removed = True
             return removed, filtered_data
@@ -428,8 +979,9 @@ def remove_outliers(rmv_outliers, data, outliers=None, removed=False):
 
 def restore_dateset(removed, data, dataframe):
     """
-    This function restores the original dataset
-    args: removed (boolean), data (DataFrame), dataframe (DataFrame) - original
+    This function restores the original dataset.
+    Masked and chunked datasets are restored one removal at a time
+    args: removed (boolean), data (DataFrame | MaskedDataset | ChunkedDataset), dataframe (DataFrame) - original
     """
     if not removed:
         print("No changes were made to the dataset.")
@@ -442,10 +994,24 @@ def restore_dateset(removed, data, dataframe):
             .strip()
         )
         if ans in ["yes", "y", "yeah", "sure"]:
-            removed = False
-            data = treat_axis(dataframe)
-            print("Original data restored.")
+            if isinstance(data, (ChunkedDataset, MaskedDataset)):
+                data = data.restore()  # undoes the last removal only
+                removed = data.removed_levels > 0
+            else:
+                removed = False
+                data = treat_axis(dataframe)
+            result_cache.bump()
+            if removed:
+                print(
+                    f"Last outlier removal undone, {data.removed_levels} removal(s) still applied."
+                )
+            else:
+                print("Original data restored.")
         else:
             print("No changes were made to the dataset.")
 
     return removed, data
+
+
+# every public function is timed when profiling is enabled (main.py --profile)
+profile_functions(globals(), __name__)
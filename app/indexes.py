@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from profiling import profiler
+
+
+def normalize_key(key):
+    """
+    This function makes lookups insensitive to case and extra whitespace
+    args: key (str)
+    """
+    return " ".join(str(key).split()).casefold()
+
+
+class CountryIndex:
+    """
+    Row positions of every country, built once per dataset.
+    Looking up a country costs time proportional to its number of rows
+    instead of scanning the whole frame with a boolean mask.
+    """
+
+    def __init__(self, data, column="Country"):
+        self.column = column
+        codes, uniques = pd.factorize(data[column])
+        self.codes = codes
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        # rows with a missing country have code -1 and sort first
+        boundaries = np.cumsum(counts) + np.count_nonzero(codes < 0)
+        starts = boundaries - counts
+
+        self.names = {}
+        self.positions = {}
+        for code, name in enumerate(uniques):
+            key = normalize_key(name)
+            positions = order[starts[code] : boundaries[code]]
+            if key in self.positions:  # e.g. "Spain" and "spain " in the same data
+                positions = np.sort(np.concatenate([self.positions[key], positions]))
+            self.names.setdefault(key, name)
+            self.positions[key] = positions
+
+    def get_name(self, country):
+        return self.names.get(normalize_key(country))
+
+    def get_positions(self, country):
+        return self.positions.get(normalize_key(country), np.empty(0, dtype=np.intp))
+
+    def lookup(self, data, country):
+        """
+        Returns the rows of a country as a new DataFrame, keeping the original index
+        """
+        return data.take(self.get_positions(country))
+
+
+CUBE_DIMENSIONS = [
+    "Country",
+    "Job category",
+    "Experience level",
+    "Employment type",
+]
+
+
+class AggregateCube:
+    """
+    Salary count, sum, sum of squares, min and max for every combination of
+    the cube dimensions present in the data. Roll-ups combine these cells,
+    so drill-down queries never go back to the rows.
+    """
+
+    @profiler.phase("aggregate")
+    def __init__(
+        self, data, dimensions=CUBE_DIMENSIONS, value="Salary in USD", mask=None
+    ):
+        # mask (boolean array) limits the cube to some rows without copying the frame
+        self.dimensions = [column for column in dimensions if column in data.columns]
+        keys = [data[column] for column in self.dimensions]
+        salaries = data[value]
+        if mask is not None:
+            salaries = salaries.where(
+                mask
+            )  # NaN salaries are skipped by the aggregations
+        cells = salaries.groupby(keys, observed=True).agg(
+            ["count", "sum", "min", "max"]
+        )
+        cells["sum_of_squares"] = (
+            (salaries.astype("float64") ** 2).groupby(keys, observed=True).sum()
+        )
+        if mask is not None:
+            cells = cells[cells["count"] > 0]
+        self.cells = cells
+
+    @classmethod
+    @profiler.phase("aggregate")
+    def merge(cls, cubes):
+        """
+        Builds one cube out of cubes computed over disjoint parts of the data
+        """
+        cubes = list(cubes)
+        merged = cls.__new__(cls)
+        merged.dimensions = cubes[0].dimensions
+        cells = pd.concat([cube.cells for cube in cubes])
+        merged.cells = cells.groupby(
+            level=list(range(cells.index.nlevels)), observed=True
+        ).agg(
+            {
+                "count": "sum",
+                "sum": "sum",
+                "min": "min",
+                "max": "max",
+                "sum_of_squares": "sum",
+            }
+        )
+        return merged
+
+    @staticmethod
+    def combine(cells, by=None):
+        """
+        Merges cells into one row per value of the `by` dimensions
+        (a single row for the whole cube when by is None)
+        """
+        aggregations = {
+            "count": "sum",
+            "sum": "sum",
+            "sum_of_squares": "sum",
+            "min": "min",
+            "max": "max",
+        }
+        if by is None:
+            combined = cells.agg(aggregations).to_frame().T
+        else:
+            combined = cells.groupby(level=by, observed=True).agg(aggregations)
+        combined["mean"] = combined["sum"] / combined["count"]
+        variance = (
+            combined["sum_of_squares"] - combined["sum"] ** 2 / combined["count"]
+        ) / (combined["count"] - 1)
+        combined["std"] = variance.clip(lower=0) ** 0.5
+        return combined
+
+    def rollup(self, by=None):
+        return self.combine(self.cells, by)
+
+    def total(self):
+        return self.rollup().iloc[0]
+
+    def slice(self, dimension, value):
+        """
+        Returns the cells where `dimension` equals `value`, without that dimension
+        """
+        return self.cells.xs(value, level=dimension)
@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+FINGERPRINT_SIZE = 4096  # bytes before the offset checked to detect rewritten files
+
+
+def get_complete_size(path, size=None):
+    """
+    This function returns the size of a file up to the end of its last
+    complete line, leaving out a row that is still being written
+    args: path (str), size (int | None) - the current size by default
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        position = size
+        while position > 0:
+            start = max(position - FINGERPRINT_SIZE, 0)
+            file.seek(start)
+            block = file.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def read_lines(path, end=None):
+    """
+    This function yields the decoded lines of a file up to the byte offset `end`,
+    so a reader consumes exactly what a TailReader considers read
+    args: path (str), end (int | None)
+    """
+    consumed = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if end is not None and consumed >= end:
+                return
+            consumed += len(line)
+            yield line.decode("utf-8")
+
+
+class TailReader:
+    """
+    Remembers how much of a csv file has been consumed, so the rows appended
+    to it later are parsed on their own instead of reading the whole file again.
+    When tailing, only complete lines are consumed: a row still being written
+    is left for the next read (the initial load reads the whole file).
+    Like the parallel reader, it expects no line breaks inside quoted fields.
+    """
+
+    def __init__(self, path, offset=None):
+        # offset: bytes already consumed, the whole file by default, as an
+        # initial load also reads a last row that has no trailing newline
+        self.path = path
+        with open(path, "rb") as file:
+            self.header = file.readline()
+        if offset is None:
+            offset = os.path.getsize(path)
+        self.offset = max(offset, len(self.header))
+        self.fingerprint = self.get_fingerprint(self.offset)
+
+    def get_fingerprint(self, offset):
+        with open(self.path, "rb") as file:
+            file.seek(max(offset - FINGERPRINT_SIZE, 0))
+            return hashlib.sha1(file.read(min(offset, FINGERPRINT_SIZE))).hexdigest()
+
+    def read_tail(self):
+        """
+        Returns the complete lines appended since the last read (b"" if there are none).
+        Raises ValueError if the file was truncated or rewritten, in which
+        case it has to be loaded again from the start
+        """
+        size = os.path.getsize(self.path)
+        if size < self.offset or self.get_fingerprint(self.offset) != self.fingerprint:
+            raise ValueError(f"{self.path} was rewritten, it must be loaded again.")
+        end = get_complete_size(self.path, size)
+        if end <= self.offset:
+            return b""
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            tail = file.read(end - self.offset)
+        self.offset = end
+        self.fingerprint = self.get_fingerprint(end)
+        return tail
@@ -1,14 +1,135 @@
+import argparse
+import atexit
 import os
 import platform
+import sys
+import threading
 
-from classes import VanillaPythonAnalysis
-from functions import *
+# functions.py (pandas and the rest of the analysis) is imported by the
+# background load, so the menu shows up without waiting for it
+from engines import ENGINES
+from menu import get_user_input
+from profiling import REPORT_PATH, profiler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Explore the jobs in data dataset.")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the csv file in chunks of this many rows (for files larger than RAM)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to aggregate the csv file (insights and chunked mode)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["auto", *ENGINES],
+        default=None,
+        help="compute the general insights over the loaded columns with this engine instead of streaming them (auto picks one by size)",
+    )
+    parser.add_argument(
+        "--batch",
+        default=None,
+        help="answer the JSON queries of this file (one per line, - for stdin) and exit",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=None,
+        help="rows shown at a time in large tables (50 by default)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=REPORT_PATH,
+        default=None,
+        help=f"time every menu option and function, and write a report at exit ({REPORT_PATH} by default)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="with --profile, record the peak memory of every menu option (slower)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="with --profile, write a cProfile dump of every menu option to this folder",
+    )
+    return parser.parse_args()
+
+
+class BackgroundLoad(threading.Thread):
+    """
+    Runs a function on a daemon thread; result() waits for it and returns
+    its value, or raises its exception
+    """
+
+    def __init__(self, target, *args):
+        super().__init__(daemon=True)
+        self.target = target
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.target(*self.args)
+        except BaseException as error:
+            self.error = error
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def load_dataset(args):
+    """
+    This function loads the dataset used by the menu, and the TailReader
+    that picks up the rows appended to the csv file afterwards.
+    The aggregate cube of an in-memory dataset is built as well
+    args: args (Namespace)
+    """
+    import functions
+
+    with profiler.timer("startup"):
+        if args.chunksize:
+            tail_reader = functions.TailReader(functions.file_path)
+            df = data_obj = functions.ChunkedDataset(
+                functions.file_path, args.chunksize, workers=args.workers
+            )
+        else:
+            df = functions.get_data_pd(list(functions.COLUMN_NAMES), compact=True)
+            data_obj = functions.MaskedDataset(functions.treat_axis(df))
+            tail_reader = functions.get_tail_reader()
+            functions.get_aggregate_cube(data_obj)
+    return df, data_obj, tail_reader
 
 
 def main():
-    df = get_data_pd()
-    data_obj = treat_axis(df)
+    args = parse_args()
+    if args.profile:
+        profiler.enable(args.profile, args.profile_memory, args.profile_dir)
+        atexit.register(profiler.write_report)
+    loading = BackgroundLoad(load_dataset, args)
     removed = False  # boolean to control if the outliers have been removed or not
+    if args.batch:
+        from queries import run_batch
+
+        df, data_obj, tail_reader = loading.result()
+        if args.batch == "-":
+            run_batch(data_obj, sys.stdin, sys.stdout)
+        else:
+            with open(args.batch, "r") as queries:
+                run_batch(data_obj, queries, sys.stdout)
+        return
 
     while True:
         if platform.system() == "Windows":
@@ -19,29 +140,56 @@ def main():
             )  # clear the terminal screen after each action from the user, making the visualization more pleasant
 
         action_to_perform = get_user_input()
-        match action_to_perform:
-            case 1:
-                get_total_lines(data_obj, removed)
-            case 2:
-                get_average_salary(data_obj)
-            case 3:
-                get_average_salary_by_country(data_obj)
-            case 4:
-                country = input("Type the desired country: ").title().strip()
-                country_info = get_country_info(data_obj, country)
-                if country_info is not None:
-                    download_data = input(
-                        "Would like to export the data for this country? Type 'yes' or press Enter to continue: "
+        if action_to_perform == 0:
+            break
+        if loading is not None:
+            # the first option waits for the background load if it is still running
+            df, data_obj, tail_reader = loading.result()
+            loading = None
+            import functions
+
+            page_size = args.page_size or functions.PAGE_SIZE
+
+        # rows appended to the csv file (e.g. a new survey year) are added as they come
+        try:
+            data_obj, new_rows = functions.ingest_appended_rows(data_obj, tail_reader)
+        except ValueError:
+            print("The data file was replaced, loading it again.\n")
+            df, data_obj, tail_reader = load_dataset(args)
+            removed = False
+        else:
+            if new_rows:
+                print(f"{new_rows} new rows added to the dataset.\n")
+
+        with profiler.timer(f"menu option {action_to_perform}"):
+            match action_to_perform:
+                case 1:
+                    functions.get_total_lines(data_obj, removed)
+                case 2:
+                    functions.get_average_salary(data_obj)
+                case 3:
+                    functions.get_average_salary_by_country(data_obj, page_size)
+                case 4:
+                    country = input("Type the desired country: ").title().strip()
+                    country_info = functions.get_country_info(
+                        data_obj, country, page_size
                     )
-                    if download_data:
-                        export_country_data(country_info, download_data, country)
-            case 5:
-                group_by_job_category(data_obj)
-            case 6:
-                country = input("Type the desired country: ").title().strip()
-                get_country_summary(data_obj, country)
-            case 7:
-                if not removed:
+                    if country_info is not None:
+                        download_data = input(
+                            "Would like to export the data for this country? Type 'yes' or press Enter to continue: "
+                        )
+                        if download_data:
+                            functions.export_country_data(
+                                country_info, download_data, country
+                            )
+                case 5:
+                    functions.group_by_job_category(data_obj, page_size)
+                case 6:
+                    country = input("Type the desired country: ").title().strip()
+                    functions.get_country_summary(data_obj, country)
+                case 7:
+                    # outliers can be removed again from the reduced data,
+                    # option 9 then undoes one removal at a time
                     z_score_default = 3
                     z_score_from_user = input(
                         f"Inform the desired threshold for the Z-score method (default is {z_score_default}): "
@@ -51,22 +199,36 @@ def main():
                     except ValueError:
                         print("Invalid input. Using default value.")
                         z_score_from_user = z_score_default
-                    rmv_outliers, outliers = detect_outliers(
-                        data_obj, z_score_from_user
+                    rmv_outliers, outliers = functions.detect_outliers(
+                        data_obj, z_score_from_user, page_size=page_size
                     )
                     if rmv_outliers is not None:
-                        removed, data_obj = remove_outliers(
-                            rmv_outliers, data_obj, outliers
+                        removed, data_obj = functions.remove_outliers(
+                            rmv_outliers, data_obj, outliers, removed
                         )
-                else:
-                    print("Outliers already removed.")
-            case 8:
-                vanilla_analyzer = VanillaPythonAnalysis(file_path)
-                vanilla_analyzer.get_insights()
-            case 9:
-                removed, data_obj = restore_dateset(removed, data_obj, df)
-            case _:
-                break
+                case 8:
+                    vanilla_analyzer = functions.get_vanilla_analysis(
+                        from_csv=bool(args.chunksize),
+                        workers=args.workers,
+                        engine=args.engine,
+                    )
+                    vanilla_analyzer.get_insights()
+                case 9:
+                    removed, data_obj = functions.restore_dateset(removed, data_obj, df)
+                case 10:
+                    file_format = input(
+                        f"Type the file format ({', '.join(functions.EXPORT_FORMATS)}) or press Enter for csv: "
+                    ).strip()
+                    functions.export_all_data(data_obj, file_format)
+                case 11:
+                    group_by = input(
+                        f"Type a column to see the correlations per group ({', '.join(functions.CORRELATION_GROUPS)}) or press Enter: "
+                    ).strip()
+                    functions.get_correlation_report(
+                        data_obj, group_by or None, page_size
+                    )
+                case _:
+                    break
         input("\nPress Enter to continue...\n")
 
 
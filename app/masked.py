@@ -0,0 +1,107 @@
+import numpy as np
+
+from columnar import concat_frames
+from indexes import CountryIndex
+
+
+class MaskedCountryIndex:
+    """
+    Country lookups limited to the active rows of a MaskedDataset.
+    The underlying CountryIndex is built once for the base frame and shared
+    by every version of the dataset.
+    """
+
+    def __init__(self, index, base, mask):
+        self.index = index
+        self.base = base
+        self.mask = mask
+
+    def get_positions(self, country):
+        positions = self.index.get_positions(country)
+        if self.mask is not None:
+            positions = positions[self.mask[positions]]
+        return positions
+
+    def get_name(self, country):
+        if not len(self.get_positions(country)):
+            return None
+        return self.index.get_name(country)
+
+    def lookup(self, data, country):
+        return self.base.take(self.get_positions(country))
+
+
+class MaskedDataset:
+    """
+    The treated dataset as an immutable base frame plus a stack of row masks.
+    Every outlier removal pushes the rows that are still active, so removing
+    is a boolean AND and restoring pops one level: no frame is ever copied
+    and each removal can be undone separately.
+    """
+
+    def __init__(self, base, masks=(), shared=None):
+        self.base = base
+        self.masks = tuple(masks)
+        # structures that only depend on the base frame, reused by every version
+        self.shared = {} if shared is None else shared
+
+    @property
+    def mask(self):
+        return self.masks[-1] if self.masks else None
+
+    @property
+    def removed_levels(self):
+        return len(self.masks)
+
+    @property
+    def shape(self):
+        rows = len(self.base) if self.mask is None else int(self.mask.sum())
+        return rows, self.base.shape[1]
+
+    @property
+    def columns(self):
+        return self.base.columns
+
+    @property
+    def country_index(self):
+        if "country_index" not in self.shared:
+            self.shared["country_index"] = CountryIndex(self.base)
+        return MaskedCountryIndex(self.shared["country_index"], self.base, self.mask)
+
+    def get_salaries(self):
+        """
+        Returns the salary column with NaN for the inactive rows
+        """
+        salaries = self.base["Salary in USD"]
+        return salaries if self.mask is None else salaries.where(self.mask)
+
+    def select(self, rows):
+        """
+        Returns the base rows flagged by a boolean mask, e.g. to display them
+        """
+        return self.base[np.asarray(rows)]
+
+    def without(self, rows):
+        """
+        Returns the dataset without the rows flagged by a boolean mask
+        """
+        keep = ~np.asarray(rows, dtype=bool)
+        if self.mask is not None:
+            keep &= self.mask
+        return MaskedDataset(self.base, self.masks + (keep,), self.shared)
+
+    def extend(self, rows):
+        """
+        Returns the dataset with rows appended to the base frame.
+        The new rows are active at every level of the mask stack
+        """
+        base = concat_frames(self.base, rows)
+        active = np.ones(len(base) - len(self.base), dtype=bool)
+        masks = [np.concatenate([mask, active]) for mask in self.masks]
+        return MaskedDataset(base, masks)
+
+    def restore(self):
+        """
+        Returns the dataset as it was before the last removal
+        """
+        return MaskedDataset(self.base, self.masks[:-1], self.shared)
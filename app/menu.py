@@ -0,0 +1,33 @@
+def get_user_input():
+    """
+    This function gets the user input for a specific action
+    """
+    options_for_the_user = [
+        "1. Check the total number of lines in the file",
+        "2. Check the global average salary in USD",
+        "3. Check the average salary by country",
+        "4. Type a country to see all available data",
+        "5. Filter data by job category and country",
+        "6. Type a country to see a summary of the data",
+        "7. Detect outliers using Z-score method",
+        "8. Check some general insights from the data",
+        "9. Restore the original data with the outliers",
+        "10. Export the data of every country",
+        "11. Check the correlations between the salary and the other dimensions",
+        "0. Exit program",
+    ]
+    options = "\n".join(options_for_the_user)
+    user_action = input(
+        f"What would you like to do? Type the corresponding number: \n\n{options}\n"
+    ).strip()
+    try:
+        action = int(user_action)
+    except ValueError:
+        print("Invalid choice.")
+        return get_user_input()
+    else:
+        if action in range(0, len(options_for_the_user)):
+            return action
+        else:
+            print("Invalid choice.")
+            return get_user_input()
@@ -0,0 +1,148 @@
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from classes import SalaryAccumulator
+from columnar import COLUMN_NAMES
+from indexes import AggregateCube
+
+MAX_RANGE_SIZE = 64 * 1024 * 1024  # bytes parsed by a worker at once
+
+
+def get_csv_files(path):
+    """
+    This function returns the csv files to aggregate:
+    the file itself, or every .csv file of a directory of shards
+    args: path (str)
+    """
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.endswith(".csv")
+        )
+    return [path]
+
+
+def split_byte_ranges(path, parts, size=None):
+    """
+    This function splits the body of a csv file (everything after the header)
+    into about `parts` byte ranges, each ending right after a newline.
+    Records must not contain line breaks inside quoted fields, which is the
+    case for the survey data.
+    Returns the header bytes and a list of (start, end) offsets.
+    args: path (str), parts (int), size (int | None) - bytes to split, the whole file by default
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        header = file.readline()
+        start = len(header)
+        step = max((size - start) // max(parts, 1), 1)
+        ranges = []
+        while start < size:
+            file.seek(min(start + step, size))
+            if file.tell() < size:
+                file.readline()  # move to the end of the current line
+            end = min(file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def get_tasks(path, workers, size=None):
+    """
+    This function returns one (file, header, start, end) task per byte range,
+    with at least one range per worker and no range above MAX_RANGE_SIZE
+    args: path (str), workers (int), size (int | None) - bytes to read of a single file
+    """
+    if size is not None and os.path.isdir(path):
+        raise ValueError("A size limit can only be given for a single csv file.")
+    tasks = []
+    for csv_file in get_csv_files(path):
+        file_size = os.path.getsize(csv_file) if size is None else size
+        parts = max(workers, -(-file_size // MAX_RANGE_SIZE))
+        header, ranges = split_byte_ranges(csv_file, parts, file_size)
+        tasks += [(csv_file, header, start, end) for start, end in ranges]
+    return tasks
+
+
+def read_range(csv_file, start, end):
+    with open(csv_file, "rb") as file:
+        file.seek(start)
+        return file.read(end - start)
+
+
+def accumulate_range(task):
+    """
+    This function runs in a worker: it parses one byte range with the csv
+    library and returns its SalaryAccumulator
+    args: task (tuple)
+    """
+    csv_file, header, start, end = task
+    return accumulate_bytes(header + read_range(csv_file, start, end))
+
+
+def accumulate_bytes(data):
+    """
+    This function parses csv bytes (header included) into a SalaryAccumulator
+    args: data (bytes)
+    """
+    stats = SalaryAccumulator()
+    for item in csv.DictReader(io.StringIO(data.decode("utf-8"), newline="")):
+        stats.add(
+            float(item.get("salary_in_usd", 0)),
+            int(item.get("work_year", 0)),
+            item.get("job_category", "Not Available"),
+            item.get("employee_residence", "Not Available"),
+        )
+    return stats
+
+
+def cube_range(task, filters=()):
+    """
+    This function runs in a worker: it reads one byte range with pandas,
+    applies the row filters and returns the range's AggregateCube
+    args: task (tuple), filters (tuple)
+    """
+    csv_file, header, start, end = task
+    chunk = pd.read_csv(
+        io.BytesIO(header + read_range(csv_file, start, end)),
+        usecols=list(COLUMN_NAMES),
+    ).rename(columns=COLUMN_NAMES)
+    for row_filter in filters:
+        chunk = chunk[~row_filter(chunk)]
+    return AggregateCube(chunk)
+
+
+def aggregate_csv(path, workers=None, size=None):
+    """
+    This function computes the statistics of the vanilla analysis
+    (mean, deviation, correlation, min/max, frequencies, per-year trend)
+    over a csv file or a directory of csv shards, one process per core
+    args: path (str), workers (int | None) - os.cpu_count() by default, size (int | None) - bytes to read of a single file
+    """
+    workers = workers or os.cpu_count()
+    stats = SalaryAccumulator()
+    with ProcessPoolExecutor(workers) as executor:
+        for partial in executor.map(accumulate_range, get_tasks(path, workers, size)):
+            stats.merge(partial)
+    return stats
+
+
+def build_cube(path, workers=None, filters=()):
+    """
+    This function builds the aggregate cube of a csv file (or directory of shards)
+    in parallel, one byte range per task
+    args: path (str), workers (int | None), filters (tuple) - row filters to apply
+    """
+    workers = workers or os.cpu_count()
+    tasks = get_tasks(path, workers)
+    if not tasks:
+        return None
+    with ProcessPoolExecutor(workers) as executor:
+        cubes = list(executor.map(cube_range, tasks, [filters] * len(tasks)))
+    return AggregateCube.merge(cubes)
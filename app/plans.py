@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+
+from chunked import ChunkedDataset
+from indexes import AggregateCube
+from masked import MaskedDataset
+from rendering import PAGE_SIZE, TablePager
+
+
+def get_filter_mask(data, filters):
+    """
+    This function returns the boolean mask of the rows of a DataFrame
+    equal to every (column, value) filter
+    args: data (DataFrame), filters (tuple)
+    """
+    mask = np.ones(len(data), dtype=bool)
+    for column, value in filters:
+        mask &= (data[column] == value).to_numpy()
+    return mask
+
+
+def split_country(filters):
+    """
+    This function separates the first country filter, answered by the
+    country index, from the other filters
+    args: filters (tuple)
+    """
+    for position, (column, value) in enumerate(filters):
+        if column == "Country":
+            return value, tuple(filters[:position]) + tuple(filters[position + 1 :])
+    return None, tuple(filters)
+
+
+class QueryPlan:
+    """
+    Lazy query over a dataset: filter -> group -> aggregate -> format -> render.
+    Every step returns a new plan and nothing runs until collect() or pager().
+    Filters are pushed down before anything else: a country filter goes
+    through the country index, filters on cube dimensions slice the aggregate
+    cube before it is rolled up, and the other filters are applied while the
+    rows (or the chunks) are scanned, so a filtered query only touches its
+    subset. Formatters only run on the rows that are displayed.
+    get_cube and get_index return the (cached) aggregate cube and country index
+    of the dataset.
+    """
+
+    def __init__(self, data, get_cube, get_index):
+        self.data = data
+        self.get_cube = get_cube
+        self.get_index = get_index
+        self.filters = ()
+        self.by = ()
+        self.aggregations = {}  # output column -> cube statistic
+        self.derived = ()  # (column, function of the aggregated frame)
+        self.formatters = {}
+
+    def copy(self, **changes):
+        plan = QueryPlan.__new__(QueryPlan)
+        plan.__dict__.update(self.__dict__, **changes)
+        return plan
+
+    def filter(self, column, value):
+        """
+        Keeps the rows where `column` equals `value`
+        (countries are matched case and whitespace insensitively)
+        """
+        return self.copy(filters=self.filters + ((column, value),))
+
+    def group_by(self, *columns):
+        return self.copy(by=self.by + columns)
+
+    def aggregate(self, **aggregations):
+        """
+        Aggregates the salaries of every group, e.g. aggregate(average="mean"),
+        with the statistics of the aggregate cube (count, sum, min, max, mean, std)
+        """
+        return self.copy(aggregations=dict(self.aggregations, **aggregations))
+
+    def with_column(self, column, function):
+        """
+        Adds a column computed from the aggregated rows
+        """
+        return self.copy(derived=self.derived + ((column, function),))
+
+    def format(self, column, formatter):
+        """
+        Formats a column for display only, page by page
+        """
+        return self.copy(formatters=dict(self.formatters, **{column: formatter}))
+
+    @property
+    def key(self):
+        """
+        Identifies the result of the plan (before formatting), to cache it
+        """
+        return (
+            "plan",
+            self.filters,
+            self.by,
+            tuple(self.aggregations.items()),
+            tuple(column for column, _ in self.derived),
+        )
+
+    def uses_cube(self):
+        dimensions = self.get_cube().dimensions
+        return all(column in dimensions for column in self.by) and all(
+            column in dimensions for column, _ in self.filters
+        )
+
+    def compile(self):
+        """
+        Returns the steps that run the plan as (description, function) pairs,
+        every function taking the result of the previous step (None at first).
+        collect() runs them and explain() lists them, so both always agree
+        """
+        if self.aggregations and self.uses_cube():
+            steps = [("aggregate cube cells", lambda _: self.get_cube().cells)]
+            steps += [
+                (f"cube slice {column}={value!r}", self.get_slice(column, value))
+                for column, value in self.filters
+            ]
+            steps.append((f"rollup by {list(self.by)}", self.rollup))
+        else:
+            steps = self.get_scan_steps()
+            if self.aggregations:
+                steps.append((f"aggregate by {list(self.by)}", self.aggregate_rows))
+        steps += [
+            (f"derive {column}", self.get_derive(column, function))
+            for column, function in self.derived
+        ]
+        return steps
+
+    def explain(self):
+        """
+        Returns the steps the plan runs, in order, e.g. to check the pushdown
+        """
+        steps = [description for description, _ in self.compile()]
+        steps += [f"format {column} on displayed rows" for column in self.formatters]
+        return steps
+
+    def get_slice(self, column, value):
+        def slice_cells(cells):
+            if column == "Country":
+                # spelled as in the data, no cells for an unknown country
+                value_name = self.get_index().get_name(value)
+            else:
+                value_name = value
+            return cells[cells.index.get_level_values(column) == value_name]
+
+        return slice_cells
+
+    def get_scan_steps(self):
+        country, filters = split_country(self.filters)
+        if country is None:
+            description = " ".join(
+                [
+                    "scan",
+                    *(f"row filter {column}={value!r}" for column, value in filters),
+                ]
+            )
+            return [(description, lambda _: self.scan(filters))]
+        # the index returns the rows of the country without a full scan
+        steps = [
+            (
+                f"country index lookup {country!r}",
+                lambda _: self.get_index().lookup(self.data, country),
+            )
+        ]
+        steps += [
+            (
+                f"row filter {column}={value!r}",
+                lambda rows, filter=(column, value): rows[
+                    get_filter_mask(rows, (filter,))
+                ],
+            )
+            for column, value in filters
+        ]
+        return steps
+
+    def scan(self, filters):
+        """
+        Returns the active rows passing the filters as a DataFrame,
+        going over the rows (or the chunks) once
+        """
+        if isinstance(self.data, ChunkedDataset):
+            return self.data.select(lambda chunk: get_filter_mask(chunk, filters))
+        if isinstance(self.data, MaskedDataset):
+            mask = get_filter_mask(self.data.base, filters)
+            if self.data.mask is not None:
+                mask &= self.data.mask
+            return self.data.select(mask)
+        return self.data[get_filter_mask(self.data, filters)]
+
+    def aggregate_rows(self, rows):
+        if rows.empty:
+            return self.get_empty_result()
+        cube = AggregateCube(rows, list(self.by)) if self.by else AggregateCube(rows)
+        return self.rollup(cube.cells)
+
+    def rollup(self, cells):
+        if cells.empty:
+            return self.get_empty_result()
+        combined = AggregateCube.combine(cells, list(self.by) or None)
+        result = combined[list(self.aggregations.values())]
+        result.columns = list(self.aggregations)
+        return result.reset_index(drop=not self.by)
+
+    def get_empty_result(self):
+        return pd.DataFrame(columns=[*self.by, *self.aggregations])
+
+    def get_derive(self, column, function):
+        return lambda rows: rows.assign(**{column: function(rows)})
+
+    def collect(self):
+        """
+        Runs the plan and returns its rows, unformatted (see pager)
+        """
+        rows = None
+        for _, step in self.compile():
+            rows = step(rows)
+        return rows
+
+    def pager(self, page_size=PAGE_SIZE, rows=None, showindex=True):
+        """
+        Returns a TablePager over the result, formatting one page at a time
+        args: page_size (int), rows (DataFrame | None) - an already collected result, showindex (bool)
+        """
+        if rows is None:
+            rows = self.collect()
+        return TablePager(rows, page_size, self.formatters, showindex)
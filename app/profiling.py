@@ -0,0 +1,236 @@
+import builtins
+import contextlib
+import cProfile
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+REPORT_PATH = "profile_report.json"
+
+
+class Profiler:
+    """
+    Opt-in timers for the menu actions and for every instrumented function.
+    Each timer excludes the time spent waiting for input(), records the time
+    of the phases (load, parse, aggregate, render) run inside it and, when
+    enabled, the peak traced memory and a cProfile dump of the outermost call.
+    Disabled, the instrumented code only pays for an attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.profile_dir = None
+        self.report_path = REPORT_PATH
+        self.timers = {}
+        self.dumps = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.original_input = None
+
+    def enable(self, report_path=REPORT_PATH, memory=False, profile_dir=None):
+        """
+        Starts recording. input() is wrapped so the time the user takes
+        to answer is not counted
+        args: report_path (str | None), memory (bool), profile_dir (str | None) - where to write the cProfile dumps
+        """
+        self.enabled = True
+        self.memory = memory
+        self.report_path = report_path
+        self.profile_dir = profile_dir
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.original_input is None:
+            self.original_input = builtins.input
+            builtins.input = self.timed_input
+
+    def disable(self):
+        self.enabled = False
+        if self.original_input is not None:
+            builtins.input = self.original_input
+            self.original_input = None
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+
+    def get_stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+            self.local.waited = 0.0
+        return self.local.stack
+
+    def timed_input(self, *args):
+        self.get_stack()
+        start = time.perf_counter()
+        try:
+            return self.original_input(*args)
+        finally:
+            self.local.waited += time.perf_counter() - start
+
+    def get_timer(self, name):
+        if name not in self.timers:
+            self.timers[name] = {
+                "calls": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "peak_bytes": None,
+                "phases": {},
+            }
+        return self.timers[name]
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Times a block of code as `name`, e.g. a menu action
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self.get_stack()
+        outermost = not stack
+        frame = {"name": name, "phases": {}}
+        stack.append(frame)
+        profile = None
+        if outermost and self.memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if outermost and self.profile_dir:
+            profile = cProfile.Profile()
+            profile.enable()
+        waited = self.local.waited
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start - (self.local.waited - waited)
+            if profile is not None:
+                profile.disable()
+            stack.pop()
+            peak = None
+            if outermost and self.memory and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+            with self.lock:
+                timer = self.get_timer(name)
+                timer["calls"] += 1
+                timer["total_seconds"] += seconds
+                timer["max_seconds"] = max(timer["max_seconds"], seconds)
+                if peak is not None:
+                    timer["peak_bytes"] = max(timer["peak_bytes"] or 0, peak)
+                for phase, phase_seconds in frame["phases"].items():
+                    timer["phases"][phase] = (
+                        timer["phases"].get(phase, 0.0) + phase_seconds
+                    )
+                if profile is not None:
+                    self.dumps += 1
+                    file_name = re.sub(r"[^\w.-]", "_", name)
+                    profile.dump_stats(
+                        os.path.join(
+                            self.profile_dir, f"{self.dumps:04d}_{file_name}.prof"
+                        )
+                    )
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Adds the time of a block of code to the `name` phase of every running timer
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self.get_stack()
+        waited = self.local.waited
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start - (self.local.waited - waited)
+            for frame in stack:
+                frame["phases"][name] = frame["phases"].get(name, 0.0) + seconds
+
+    def get_report(self):
+        with self.lock:
+            timers = {name: dict(timer) for name, timer in self.timers.items()}
+        for timer in timers.values():
+            timer["mean_seconds"] = timer["total_seconds"] / timer["calls"]
+        return {
+            "memory": self.memory,
+            "profile_dir": self.profile_dir,
+            "timers": timers,
+        }
+
+    def write_report(self):
+        """
+        Writes the report as JSON and prints the slowest timers
+        """
+        report = self.get_report()
+        if self.report_path:
+            with open(self.report_path, "w") as file:
+                json.dump(report, file, indent=2)
+        slowest = sorted(
+            report["timers"].items(),
+            key=lambda item: item[1]["total_seconds"],
+            reverse=True,
+        )
+        print(f"\n{'timer':<55} {'calls':>6} {'total (s)':>10} {'max (s)':>10}")
+        for name, timer in slowest[:20]:
+            print(
+                f"{name:<55} {timer['calls']:>6} {timer['total_seconds']:>10.4f} {timer['max_seconds']:>10.4f}"
+            )
+        if self.report_path:
+            print(f"Profile report written to {self.report_path}")
+        return report
+
+
+profiler = Profiler()
+
+
+def profiled(function):
+    """
+    This decorator times every call of a function under its qualified name
+    args: function (callable)
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return function(*args, **kwargs)
+        with profiler.timer(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def profiled_class(cls):
+    """
+    This class decorator times every public method defined in the class
+    args: cls (type)
+    """
+    for name, value in list(vars(cls).items()):
+        if inspect.isfunction(value) and not name.startswith("_"):
+            setattr(cls, name, profiled(value))
+    return cls
+
+
+def profile_functions(namespace, module):
+    """
+    This function times every public function defined in a module,
+    called at the end of the module with its globals()
+    args: namespace (dict), module (str)
+    """
+    for name, value in list(namespace.items()):
+        if (
+            inspect.isfunction(value)
+            and value.__module__ == module
+            and not name.startswith("_")
+        ):
+            namespace[name] = profiled(value)
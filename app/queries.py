@@ -0,0 +1,205 @@
+import json
+
+import numpy as np
+
+from chunked import ChunkedDataset
+from functions import (
+    get_aggregate_cube,
+    get_country_index,
+    get_country_rows,
+    get_country_stats,
+    get_outlier_mask,
+    get_salary_sketches,
+    rate_provider,
+)
+from masked import MaskedDataset
+from sketches import DEFAULT_QUANTILES, HISTOGRAM_BINS
+
+DEFAULT_LIMIT = 100  # rows returned by the queries listing rows
+
+
+def get_active_rows(data, rows):
+    """
+    This function returns the rows of a dataset flagged by a boolean mask
+    (or a row filter for a ChunkedDataset) as a DataFrame
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), rows (boolean Series | row filter)
+    """
+    if isinstance(data, (ChunkedDataset, MaskedDataset)):
+        return data.select(rows)
+    return data[rows]
+
+
+def get_records(rows, limit=DEFAULT_LIMIT):
+    return rows.head(limit).reset_index(drop=True).to_dict("records")
+
+
+def query_total_lines(data):
+    return {"rows": data.shape[0]}
+
+
+def query_average_salary(data):
+    total = get_aggregate_cube(data).total()
+    return {"average_salary": total["mean"], "rows": int(total["count"])}
+
+
+def query_average_salary_by_country(data):
+    cube = get_aggregate_cube(data)
+    overall_mean_salary = cube.total()["mean"]
+    by_country = cube.rollup("Country")
+    return [
+        {
+            "country": country,
+            "average_salary": row["mean"],
+            "responses": int(row["count"]),
+            "variation": (row["mean"] - overall_mean_salary)
+            / overall_mean_salary
+            * 100,
+        }
+        for country, row in by_country.iterrows()
+    ]
+
+
+def query_country_summary(data, country, currency="USD"):
+    stats = get_country_stats(data, country)
+    if stats is None:
+        raise LookupError(f"No data found for {country}.")
+    rate = 1.0 if currency == "USD" else rate_provider.get_rate("USD", currency)
+    for key in ["average_salary", "std_salary", "highest_salary", "lowest_salary"]:
+        stats[key] *= rate
+    for quantile in DEFAULT_QUANTILES:
+        stats[f"{quantile}_salary"] *= rate
+    stats["currency"] = currency
+    return stats
+
+
+def query_job_categories(data, country=None):
+    if country is not None:
+        data = get_country_rows(data, country)
+        if data.empty:
+            raise LookupError(f"No data found for {country}.")
+    by_category = get_aggregate_cube(data).rollup(["Country", "Job category"])
+    return [
+        {
+            "country": name,
+            "job_category": category,
+            "average_salary": row["mean"],
+            "responses": int(row["count"]),
+        }
+        for (name, category), row in by_category.iterrows()
+    ]
+
+
+def query_salary_distribution(data, by=None, value=None, bins=HISTOGRAM_BINS):
+    # by: "Country" or "Job category", value: the country or category (all rows by default)
+    if by == "Country":
+        value = get_country_index(data).get_name(value) or value
+    sketch = get_salary_sketches(data).get(by, value)
+    if sketch is None or sketch.count == 0:
+        raise LookupError(f"No data found for {value}.")
+    return {
+        "count": sketch.count,
+        "quantiles": sketch.quantiles(),
+        "histogram": [
+            {"low": low, "high": high, "count": count}
+            for low, high, count in sketch.histogram(bins)
+        ],
+    }
+
+
+def query_country_rows(data, country, limit=DEFAULT_LIMIT):
+    rows = get_country_rows(data, country)
+    return {"count": len(rows), "rows": get_records(rows, limit)}
+
+
+def query_outliers(
+    data, threshold=3, group_by=None, method="zscore", limit=DEFAULT_LIMIT
+):
+    outliers = get_active_rows(
+        data, get_outlier_mask(data, threshold, group_by, method)
+    )
+    return {"count": len(outliers), "rows": get_records(outliers, limit)}
+
+
+QUERIES = {
+    "total_lines": query_total_lines,
+    "average_salary": query_average_salary,
+    "average_salary_by_country": query_average_salary_by_country,
+    "country_summary": query_country_summary,
+    "job_categories": query_job_categories,
+    "salary_distribution": query_salary_distribution,
+    "country_rows": query_country_rows,
+    "outliers": query_outliers,
+}
+
+
+def run_query(data, query):
+    """
+    This function answers one query, e.g. {"query": "outliers", "threshold": 2.5}.
+    The other keys are the query parameters, except "id" which is only echoed back.
+    Returns the response, with either a "result" or an "error" key
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), query (dict)
+    """
+    params = dict(query)
+    response = {"id": params.pop("id", None), "query": params.pop("query", None)}
+    if response["query"] not in QUERIES:
+        response["error"] = f"Unknown query: {response['query']}."
+        return response
+    try:
+        response["result"] = QUERIES[response["query"]](data, **params)
+    except Exception as error:  # one failing query must not stop the batch
+        response["error"] = f"{type(error).__name__}: {error}"
+    return response
+
+
+def to_json_value(value):
+    """
+    This function turns numpy and pandas values into plain JSON values,
+    with null for NaN (e.g. the deviation of a country with one response)
+    args: value (object)
+    """
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def dump_response(response):
+    return json.dumps(to_json_value(response), allow_nan=False)
+
+
+def run_batch(data, lines, output):
+    """
+    This function answers a stream of JSON queries, one per line, and writes
+    one JSON response per line. The dataset and its cached aggregates are
+    shared by all the queries. Blank lines and lines starting with # are skipped.
+    Returns the number of queries answered.
+    args: data (DataFrame | MaskedDataset | ChunkedDataset), lines (iterable), output (file)
+    """
+    answered = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("a query must be a JSON object")
+        except ValueError as error:
+            response = {
+                "id": None,
+                "line": line_number,
+                "error": f"Invalid query: {error}",
+            }
+        else:
+            response = run_query(data, query)
+        output.write(dump_response(response) + "\n")
+        answered += 1
+    output.flush()
+    return answered
@@ -0,0 +1,111 @@
+import locale
+
+import pandas as pd
+from tabulate import tabulate
+
+from profiling import profiler
+
+PAGE_SIZE = 50  # rows shown (and formatted) at a time
+
+
+def format_currency_column(amounts, currency="USD"):
+    """
+    This function formats a whole column of amounts as currency at once.
+    USD amounts follow the monetary conventions of the current locale
+    (symbol, separators, sign), like locale.currency with grouping
+    args: amounts (Series | array), currency (str)
+    """
+    amounts = pd.Series(amounts, dtype="float64")
+    text = amounts.abs().map("{:,.2f}".format)
+    negative = amounts < 0
+    if currency != "USD":
+        return ("-" + text).where(negative, text) + f" {currency}"
+
+    conv = locale.localeconv()
+    separators = {",": conv["mon_thousands_sep"], ".": conv["mon_decimal_point"]}
+    if separators != {",": ",", ".": "."}:
+        text = text.str.translate(str.maketrans(separators))
+    formatted = text.copy()
+    for sign, rows, prefix in [
+        ("", ~negative, "p"),
+        (conv["negative_sign"] or "-", negative, "n"),
+    ]:
+        space = " " if conv[f"{prefix}_sep_by_space"] else ""
+        if conv[f"{prefix}_cs_precedes"]:
+            with_symbol = conv["currency_symbol"] + space + text[rows]
+        else:
+            with_symbol = text[rows] + space + conv["currency_symbol"]
+        formatted[rows] = sign + with_symbol
+    return formatted
+
+
+class TablePager:
+    """
+    Shows a table one page at a time.
+    Only the rows of the page being shown go through the formatters and
+    tabulate, so the first page of a large result is printed right away.
+    """
+
+    def __init__(self, data, page_size=PAGE_SIZE, formatters=None, showindex=True):
+        # formatters maps a column name to a function formatting a whole column
+        self.data = data
+        self.page_size = max(int(page_size), 1)
+        self.formatters = formatters or {}
+        self.showindex = showindex
+        self.page = 0
+
+    @property
+    def page_count(self):
+        return max(-(-len(self.data) // self.page_size), 1)
+
+    def get_page(self, number):
+        """
+        Returns the formatted rows of a page (numbered from 0)
+        """
+        start = number * self.page_size
+        rows = self.data.iloc[start : start + self.page_size].copy()
+        for column, formatter in self.formatters.items():
+            if column in rows.columns:
+                rows[column] = formatter(rows[column]).to_numpy()
+        return rows
+
+    @profiler.phase("render")
+    def render(self, number):
+        self.page = min(max(number, 0), self.page_count - 1)
+        table = tabulate(
+            self.get_page(self.page),
+            headers="keys",
+            tablefmt="pretty",
+            showindex=self.showindex,
+        )
+        if self.page_count > 1:
+            table += (
+                f"\nPage {self.page + 1} of {self.page_count} ({len(self.data)} rows)"
+            )
+        return table
+
+    def head(self):
+        return self.render(0)
+
+    def next(self):
+        return self.render(self.page + 1)
+
+    def prev(self):
+        return self.render(self.page - 1)
+
+    def browse(self, ask=None):
+        """
+        Prints the first page, then lets the user move between pages
+        until they press Enter
+        """
+        ask = ask or input  # looked up on every call, so a patched input() is used
+        print(self.head())
+        commands = {"n": self.next, "p": self.prev, "h": self.head}
+        while self.page_count > 1:
+            command = ask(
+                "Type 'n' for the next page, 'p' for the previous one, 'h' for the first one or press Enter to continue: "
+            )
+            command = commands.get(command.lower().strip())
+            if command is None:
+                break
+            print(command())
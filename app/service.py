@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from chunked import ChunkedDataset
+from columnar import COLUMN_NAMES
+from functions import (
+    file_path,
+    get_aggregate_cube,
+    get_country_index,
+    get_data_pd,
+    treat_axis,
+)
+from masked import MaskedDataset
+from queries import dump_response, run_query
+
+LATENCY_SAMPLES = 1000  # latencies kept per endpoint for the percentiles
+MAX_BODY_SIZE = 1024 * 1024
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+}
+
+
+class LatencyMetrics:
+    """
+    Request count, errors and latency percentiles of every endpoint,
+    computed from the most recent LATENCY_SAMPLES requests.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.coalesced = 0
+
+    def record(self, endpoint, seconds, failed=False):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                "requests": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "samples": deque(maxlen=LATENCY_SAMPLES),
+            }
+        metrics = self.endpoints[endpoint]
+        metrics["requests"] += 1
+        metrics["errors"] += int(failed)
+        metrics["total_seconds"] += seconds
+        metrics["max_seconds"] = max(metrics["max_seconds"], seconds)
+        metrics["samples"].append(seconds)
+
+    def summary(self):
+        endpoints = {}
+        for endpoint, metrics in self.endpoints.items():
+            p50, p95, p99 = np.percentile(metrics["samples"], [50, 95, 99])
+            endpoints[endpoint] = {
+                "requests": metrics["requests"],
+                "errors": metrics["errors"],
+                "mean_seconds": metrics["total_seconds"] / metrics["requests"],
+                "p50_seconds": p50,
+                "p95_seconds": p95,
+                "p99_seconds": p99,
+                "max_seconds": metrics["max_seconds"],
+            }
+        return {"coalesced_requests": self.coalesced, "endpoints": endpoints}
+
+
+def parse_value(value):
+    """
+    This function reads a query string value as JSON when possible,
+    so ?threshold=2.5 is a number and ?country=Spain stays a string
+    args: value (str)
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class QueryService:
+    """
+    HTTP service answering the queries of queries.py over a resident dataset.
+    The event loop only parses requests: queries run on a pool of threads,
+    and identical queries arriving while one is running share its result.
+
+    GET /<query>?param=value   e.g. /country_summary?country=Spain&currency=EUR
+    POST /query                with a JSON query, as in the batch mode
+    GET /metrics               request counts and latencies
+    GET /health
+    """
+
+    def __init__(self, data, workers=None):
+        self.data = data
+        self.executor = ThreadPoolExecutor(workers)
+        self.pending = {}
+        self.metrics = LatencyMetrics()
+
+    def warm_up(self):
+        """
+        Builds the aggregate cube and the country index before the first request
+        """
+        get_aggregate_cube(self.data)
+        get_country_index(self.data)
+
+    async def answer(self, query):
+        """
+        Runs a query on the worker pool, or waits for the identical query
+        that is already running
+        """
+        query = dict(query)
+        query_id = query.pop("id", None)
+        key = json.dumps(query, sort_keys=True, default=str)
+        task = self.pending.get(key)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(self.executor, run_query, self.data, query)
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        else:
+            self.metrics.coalesced += 1
+        response = dict(await asyncio.shield(task))
+        response["id"] = query_id
+        return response
+
+    async def route(self, method, target, body):
+        """
+        Returns the endpoint name, the status code and the response of a request
+        """
+        url = urlsplit(target)
+        endpoint = url.path.strip("/")
+        if endpoint == "health":
+            return endpoint, 200, {"status": "ok", "rows": self.data.shape[0]}
+        if endpoint == "metrics":
+            return endpoint, 200, self.metrics.summary()
+        if endpoint == "query":
+            if method != "POST":
+                return endpoint, 405, {"error": "Use POST with a JSON query."}
+            try:
+                query = json.loads(body or b"{}")
+                if not isinstance(query, dict):
+                    raise ValueError("a query must be a JSON object")
+            except ValueError as error:
+                return endpoint, 400, {"error": f"Invalid query: {error}"}
+            endpoint = str(query.get("query"))
+        elif method == "GET":
+            query = {key: parse_value(value) for key, value in parse_qsl(url.query)}
+            query["query"] = endpoint
+        else:
+            return endpoint, 405, {"error": "Use GET, or POST /query."}
+
+        response = await self.answer(query)
+        if "error" not in response:
+            return endpoint, 200, response
+        if response["error"].startswith("Unknown query"):
+            return "unknown", 404, response
+        return endpoint, 400, response
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        endpoint, status = None, 400
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if len(request_line) != 3 or not 0 <= length <= MAX_BODY_SIZE:
+                response = {"error": "Malformed request."}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                endpoint, status, response = await self.route(
+                    request_line[0].upper(), request_line[1], body
+                )
+        except (ValueError, asyncio.IncompleteReadError):
+            response = {"error": "Malformed request."}
+
+        payload = dump_response(response).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("latin-1")
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        if endpoint is not None:
+            self.metrics.record(endpoint, time.perf_counter() - start, status != 200)
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """
+        Starts listening and returns the asyncio server (port=0 picks a free port)
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(service, host, port):
+    server = await service.start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving on http://{address[0]}:{address[1]}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the analyses over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="threads running the queries"
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the csv file in chunks of this many rows (for files larger than RAM)",
+    )
+    args = parser.parse_args()
+
+    if args.chunksize:
+        data = ChunkedDataset(file_path, args.chunksize)
+    else:
+        data = MaskedDataset(treat_axis(get_data_pd(list(COLUMN_NAMES), compact=True)))
+    service = QueryService(data, args.workers)
+    service.warm_up()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import bisect
+import math
+
+from profiling import profiler
+
+DEFAULT_K = 200  # items of the top compactor, the rank error is about 1.7 / k
+# quantiles reported by default, by name
+DEFAULT_QUANTILES = {"p10": 0.1, "median": 0.5, "p90": 0.9, "p99": 0.99}
+HISTOGRAM_BINS = 10
+SKETCH_DIMENSIONS = ["Country", "Job category"]
+
+
+def get_rank_index(quantile, count):
+    """
+    This function returns the position of a quantile in sorted data: the smallest
+    value with at least `quantile` of the data at or below it (numpy's
+    "inverted_cdf" method), so exact and sketched quantiles are comparable
+    args: quantile (float), count (int)
+    """
+    return min(max(math.ceil(quantile * count) - 1, 0), count - 1)
+
+
+def get_exact_quantiles(values, quantiles=DEFAULT_QUANTILES):
+    """
+    This function returns the exact quantiles of sorted values, with the
+    definition used by the sketches
+    args: values (list) - sorted, quantiles (dict) - name -> quantile
+    """
+    if not values:
+        return {name: None for name in quantiles}
+    return {
+        name: values[get_rank_index(quantile, len(values))]
+        for name, quantile in quantiles.items()
+    }
+
+
+def get_histogram(pairs, lowest, highest, bins=HISTOGRAM_BINS):
+    """
+    This function counts weighted values into `bins` equal-width bins
+    between lowest and highest. Returns (low edge, high edge, count) per bin
+    args: pairs (iterable of (value, weight)), lowest (float), highest (float), bins (int)
+    """
+    width = (highest - lowest) / bins or 1.0
+    counts = [0] * bins
+    for value, weight in pairs:
+        counts[min(int((value - lowest) / width), bins - 1)] += weight
+    return [
+        (lowest + width * position, lowest + width * (position + 1), count)
+        for position, count in enumerate(counts)
+    ]
+
+
+class QuantileSketch:
+    """
+    KLL-style mergeable quantile sketch. Values are kept in a stack of
+    compactors where an item of level h stands for 2**h values: when the
+    sketch outgrows its capacity, the lowest full level is sorted and every
+    other item is promoted to the next level. Memory stays around 3 * k items
+    however many values are added, and sketches built over disjoint data merge
+    into the sketch of their union, so they can be computed chunk by chunk or
+    by parallel workers. Until the first compaction the quantiles are exact.
+    """
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.count = 0
+        self.lowest = None
+        self.highest = None
+        self.levels = [[]]
+        self.offsets = [0]  # alternates which half of a level is promoted
+        self.size = 0
+        self.max_size = self.get_capacity(0)
+
+    def get_capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(self.k * (2 / 3) ** depth), 2)
+
+    def add(self, value):
+        self.count += 1
+        if self.lowest is None or value < self.lowest:
+            self.lowest = value
+        if self.highest is None or value > self.highest:
+            self.highest = value
+        self.levels[0].append(value)
+        self.size += 1
+        if self.size > self.max_size:
+            self.compress()
+
+    def update(self, values):
+        """
+        Adds many values at once, sorting them in bulk instead of one by one
+        args: values (iterable)
+        """
+        values = list(values)
+        if not values:
+            return self
+        self.count += len(values)
+        lowest, highest = min(values), max(values)
+        if self.lowest is None or lowest < self.lowest:
+            self.lowest = lowest
+        if self.highest is None or highest > self.highest:
+            self.highest = highest
+        self.levels[0].extend(values)
+        self.size += len(values)
+        self.compress()
+        return self
+
+    def compact(self, level):
+        if level + 1 == len(self.levels):
+            self.levels.append([])
+            self.offsets.append(0)
+        items = sorted(self.levels[level])
+        # an odd item stays at its level, so the promoted items keep the total weight
+        leftover = [items.pop()] if len(items) % 2 else []
+        offset = self.offsets[level]
+        self.offsets[level] = 1 - offset
+        self.levels[level + 1].extend(items[offset::2])
+        self.levels[level] = leftover
+        self.size -= len(items) // 2
+
+    def compress(self):
+        while True:
+            self.max_size = sum(
+                self.get_capacity(level) for level in range(len(self.levels))
+            )
+            if self.size <= self.max_size:
+                return
+            for level, items in enumerate(self.levels):
+                if len(items) >= self.get_capacity(level):
+                    self.compact(level)
+                    break
+
+    def merge(self, other):
+        """
+        Adds the values of a sketch built over other data
+        """
+        if other.count == 0:
+            return self
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+                self.offsets.append(0)
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.size += other.size
+        if self.lowest is None or other.lowest < self.lowest:
+            self.lowest = other.lowest
+        if self.highest is None or other.highest > self.highest:
+            self.highest = other.highest
+        self.compress()
+        return self
+
+    def get_weighted_items(self):
+        """
+        Returns the sorted (value, weight) pairs standing for the added values
+        """
+        return sorted(
+            (value, 2**level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+
+    def quantiles(self, quantiles=DEFAULT_QUANTILES):
+        """
+        Returns the estimated value of every quantile, e.g. {"median": 115000.0}
+        args: quantiles (dict) - name -> quantile between 0 and 1
+        """
+        if self.count == 0:
+            return {name: None for name in quantiles}
+        items = self.get_weighted_items()
+        ranks = []
+        rank = 0
+        for _, weight in items:
+            rank += weight
+            ranks.append(rank)
+        result = {}
+        for name, quantile in quantiles.items():
+            if quantile <= 0:
+                result[name] = self.lowest
+            elif quantile >= 1:
+                result[name] = self.highest
+            else:
+                # first item whose cumulated weight covers the rank
+                position = bisect.bisect_right(
+                    ranks, get_rank_index(quantile, self.count)
+                )
+                result[name] = items[min(position, len(items) - 1)][0]
+        return result
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        """
+        Returns the estimated (low edge, high edge, count) of `bins` equal-width
+        bins between the lowest and the highest value
+        """
+        if self.count == 0:
+            return []
+        return get_histogram(self.get_weighted_items(), self.lowest, self.highest, bins)
+
+
+class SalarySketches:
+    """
+    Salary quantile sketches of a dataset: one for all the rows and one per
+    value of every sketch dimension (e.g. per country), filled in one pass
+    and mergeable like the aggregate cube.
+    """
+
+    def __init__(self, dimensions=SKETCH_DIMENSIONS, k=DEFAULT_K):
+        self.dimensions = list(dimensions)
+        self.k = k
+        self.total = QuantileSketch(k)
+        self.groups = {dimension: {} for dimension in self.dimensions}
+
+    @profiler.phase("aggregate")
+    def update(self, data, value="Salary in USD"):
+        """
+        Adds the rows of a DataFrame (missing salaries are skipped)
+        args: data (DataFrame), value (str)
+        """
+        salaries = data[value].dropna().astype("float64")
+        self.total.update(salaries.tolist())
+        for dimension in self.dimensions:
+            if dimension not in data.columns:
+                continue
+            groups = self.groups[dimension]
+            keys = data[dimension].loc[salaries.index]
+            for key, group in salaries.groupby(keys, observed=True, sort=False):
+                if key not in groups:
+                    groups[key] = QuantileSketch(self.k)
+                groups[key].update(group.tolist())
+        return self
+
+    def merge(self, other):
+        """
+        Adds the sketches built over other rows
+        """
+        self.total.merge(other.total)
+        for dimension in self.dimensions:
+            groups = self.groups[dimension]
+            for key, sketch in other.groups.get(dimension, {}).items():
+                if key not in groups:
+                    groups[key] = QuantileSketch(self.k)
+                groups[key].merge(sketch)
+        return self
+
+    def get(self, dimension=None, key=None):
+        """
+        Returns the sketch of one group, the one of all the rows when
+        dimension is None, or None if there is no such group
+        args: dimension (str | None), key (object)
+        """
+        if dimension is None:
+            return self.total
+        if dimension not in self.groups:
+            raise ValueError(
+                f"No sketches by {dimension}, use one of {', '.join(self.dimensions)}."
+            )
+        return self.groups[dimension].get(key)
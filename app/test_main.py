@@ -4,12 +4,38 @@ warnings.filterwarnings(
     "ignore", category=DeprecationWarning
 )  # importing first to ignore warnings from pandas
 
-from classes import VanillaPythonAnalysis
+from aggregators import GroupByAggregator
+from classes import (
+    ExchangeRateCache,
+    ResultCache,
+    SalaryAnalysis,
+    StreamingPythonAnalysis,
+    VanillaPythonAnalysis,
+)
 from functions import *
+from benchmark import generate_dataset
+from correlation import FEATURE_NAMES, accumulate_covariance, encode_features
+from indexes import CUBE_DIMENSIONS
+from ingest import TailReader
+from engines import NUMPY_MIN_ROWS, get_available_engines, select_engine
+from sketches import DEFAULT_QUANTILES, QuantileSketch
+from profiling import profiler
+from queries import run_batch, run_query
+from service import QueryService
+import main
+
+import asyncio
+import csv
+import io
+import json
+import subprocess
+import sys
+import time
+import weakref
 
 import numpy as np
 import pandas as pd
-
+import pytest
 
 data_file = get_data_pd()
 analysis = VanillaPythonAnalysis(file_path)
@@ -48,3 +74,991 @@ def test_get_correlation():
         np.corrcoef(data_file["work_year"], data_file["salary_in_usd"])[0, 1],
         atol=1e-8,
     )
+
+
+treated_data = treat_axis(data_file)
+
+
+def test_outlier_mask():
+    salaries = treated_data["Salary in USD"]
+    z_scores = (salaries - salaries.mean()) / salaries.std()
+    expected = z_scores.abs() > 3
+    assert get_outlier_mask(treated_data).equals(expected)
+
+
+def test_grouped_outlier_mask():
+    mask = get_outlier_mask(treated_data, 2, group_by="Experience level")
+    for _, group in treated_data.groupby("Experience level"):
+        salaries = group["Salary in USD"]
+        expected = ((salaries - salaries.mean()) / salaries.std()).abs() > 2
+        assert mask[group.index].equals(expected)
+
+
+def test_mad_outlier_mask():
+    salaries = treated_data["Salary in USD"]
+    median = salaries.median()
+    mad = (salaries - median).abs().median()
+    expected = (0.6745 * (salaries - median) / mad).abs() > 3.5
+    assert get_outlier_mask(treated_data, 3.5, method="mad").equals(expected)
+
+
+def test_streaming_analysis():
+    streaming = StreamingPythonAnalysis(file_path)
+    assert np.isclose(streaming.get_average_salary(), analysis.get_average_salary())
+    assert np.isclose(streaming.get_salary_deviaton(), analysis.get_salary_deviaton())
+    assert np.allclose(streaming.get_years_deviaton(), analysis.get_years_deviaton())
+    assert np.isclose(
+        streaming.get_correlation_salary_years(),
+        analysis.get_correlation_salary_years(),
+    )
+    assert (
+        streaming.get_job_category_frequency() == analysis.get_job_category_frequency()
+    )
+    assert np.allclose(
+        streaming.get_tendency_per_year(), analysis.get_tendency_per_year()
+    )
+    assert np.allclose(
+        [salary for _, salary in streaming.get_average_salary_by_country()],
+        [salary for _, salary in analysis.get_average_salary_by_country()],
+    )
+    assert streaming.get_lowest_salary() == analysis.get_lowest_salary()
+    assert streaming.get_highest_salary() == analysis.get_highest_salary()
+    # only the analysis that keeps the rows groups them
+    assert isinstance(streaming, SalaryAnalysis)
+    assert not isinstance(streaming, VanillaPythonAnalysis)
+    assert not hasattr(streaming, "group_by") and not hasattr(streaming, "get_engine")
+
+
+def test_tendency_per_year():
+    tendency_pandas = data_file.groupby("work_year")["salary_in_usd"].mean()
+    assert np.allclose(
+        [salary for _, salary in analysis.get_tendency_per_year()],
+        tendency_pandas.values,
+    )
+
+
+def test_group_by():
+    grouped = analysis.group_by("employee_residence", "job_category")
+    stats_vanilla = {
+        "count": grouped.count(),
+        "sum": grouped.sum(),
+        "mean": grouped.mean(),
+        "min": grouped.min(),
+        "max": grouped.max(),
+    }
+    stats_pandas = data_file.groupby(["employee_residence", "job_category"])[
+        "salary_in_usd"
+    ].agg(["count", "sum", "mean", "min", "max"])
+    for key, row in stats_pandas.iterrows():
+        for stat, values in stats_vanilla.items():
+            assert np.isclose(values[key], row[stat])
+
+
+def test_average_salary_by_country():
+    average_pandas = data_file.groupby("employee_residence")["salary_in_usd"].mean()
+    average_vanilla = dict(analysis.get_average_salary_by_country())
+    assert np.allclose(
+        [average_vanilla[country] for country in average_pandas.index],
+        average_pandas.values,
+    )
+
+
+def test_count_file_lines():
+    assert count_file_lines() == (len(get_data_file()), len(get_data_csv()))
+
+
+def test_count_file_lines_quoted(tmp_path):
+    csv_file = tmp_path / "quoted.csv"
+    csv_file.write_text('a,b\n"multi\nline",1\n\n"say ""hi""",2\r\n3,4')
+    with open(csv_file, newline="") as file:
+        records = len(list(csv.DictReader(file)))
+    assert count_file_lines(str(csv_file)) == (6, records)
+
+
+def test_exchange_rate_cache(tmp_path):
+    calls = []
+
+    def local_rates(base):
+        calls.append(base)
+        return {"EUR": 0.9, "BRL": 5.0}
+
+    def offline(base):
+        raise ConnectionError("offline")
+
+    store_path = str(tmp_path / "rates.json")
+    rates = ExchangeRateCache(store_path, [offline, local_rates])
+    assert rates.get_rate("USD", "EUR") == 0.9
+    assert rates.get_rate("USD", "BRL") == 5.0
+    assert rates.get_rate("USD", "USD") == 1.0
+    assert calls == ["USD"]
+
+    # a new session with no reachable source falls back to the persisted store
+    offline_rates = ExchangeRateCache(store_path, [offline], ttl=0)
+    salaries = treated_data["Salary in USD"]
+    converted = salaries * offline_rates.get_rate("USD", "BRL")
+    assert np.allclose(converted, salaries * 5.0)
+
+
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_columnar_cache():
+    pd.testing.assert_frame_equal(load_frame(file_path), pd.read_csv(file_path))
+    # the columns are read from the mapped files, not copied into memory
+    assert is_memory_mapped(load_frame(file_path)["salary_in_usd"].to_numpy())
+    compact = load_frame(file_path, ["job_category"], compact=True)
+    assert is_memory_mapped(compact["job_category"].array.codes)
+    columns = load_python_columns(
+        file_path, ["salary_in_usd", "work_year", "job_category", "employee_residence"]
+    )
+    cached = VanillaPythonAnalysis(columns=columns)
+    assert cached.salaries == analysis.salaries
+    assert cached.get_job_category_frequency() == analysis.get_job_category_frequency()
+    assert dict(cached.group_by("employee_residence").mean()) == dict(
+        analysis.group_by("employee_residence").mean()
+    )
+
+
+def test_columnar_cache_invalidation(tmp_path):
+    csv_file = tmp_path / "jobs.csv"
+    csv_file.write_text("work_year,job_category,salary_in_usd\n2023,Data Science,100\n")
+    assert load_frame(str(csv_file))["salary_in_usd"].tolist() == [100]
+    with open(csv_file, "a") as file:
+        file.write("2024,Data Analysis,200\n")
+    reloaded = load_frame(str(csv_file))
+    assert reloaded["salary_in_usd"].tolist() == [100, 200]
+    assert reloaded["job_category"].tolist() == ["Data Science", "Data Analysis"]
+
+
+def test_columnar_cache_rebuild_under_loaded_frames(tmp_path):
+    csv_file = tmp_path / "jobs.csv"
+    data_file.iloc[:200].to_csv(csv_file, index=False)
+    old = load_frame(str(csv_file), list(COLUMN_NAMES), compact=True)
+    expected = old["employee_residence"].value_counts()
+    # a new country changes the codes of the rebuilt cache
+    new_row = data_file.iloc[[0]].assign(employee_residence="Atlantis")
+    new_row.to_csv(csv_file, mode="a", header=False, index=False)
+    new = load_frame(str(csv_file), list(COLUMN_NAMES), compact=True)
+    assert (new["employee_residence"] == "Atlantis").sum() == 1
+    # the frame loaded before still maps the previous files
+    assert old["employee_residence"].value_counts().equals(expected)
+    assert len(old) == 200 and len(new) == 201
+    assert not list(tmp_path.glob(".cache/*/*.tmp"))
+    # treat_axis keeps the columns memory-mapped
+    treated = treat_axis(new)
+    assert is_memory_mapped(treated["Country"].array.codes)
+
+
+def test_result_cache():
+    cache = ResultCache(maxsize=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value * 2
+
+    assert cache.get_or_compute("a", lambda: compute(1)) == 2
+    assert cache.get_or_compute("a", lambda: compute(1)) == 2
+    assert calls == [1]
+    cache.bump()  # e.g. outliers removed: the old result must not be reused
+    assert cache.get_or_compute("a", lambda: compute(3)) == 6
+    cache.get_or_compute("b", lambda: compute(4))
+    cache.get_or_compute("c", lambda: compute(5))
+    assert cache.stats() == {"generation": 1, "hits": 1, "misses": 4, "size": 2}
+
+
+def test_cached_average_salary():
+    first = cached_result(treated_data, "mean", treated_data["Salary in USD"].mean)
+    hits = result_cache.hits
+    second = cached_result(treated_data, "mean", lambda: None)
+    assert first == second
+    assert result_cache.hits == hits + 1
+
+
+def test_cached_result_id_reuse():
+    # short-lived frames often get the id of the previous one
+    for value in range(20):
+        frame = pd.DataFrame({"Salary in USD": [float(value)]})
+        assert cached_result(frame, "id_reuse", frame["Salary in USD"].sum) == value
+        del frame
+    # an entry left under the id by another dataset is not returned
+    other = treated_data.head(3)
+    result_cache.get_or_compute(
+        (id(other), "stale"), lambda: (weakref.ref(treated_data), "stale")
+    )
+    assert cached_result(other, "stale", lambda: "fresh") == "fresh"
+    assert get_cached_result(other, "stale") == "fresh"
+
+
+def test_country_index():
+    expected = treated_data[treated_data["Country"] == "United Kingdom"]
+    pd.testing.assert_frame_equal(
+        get_country_rows(treated_data, "  united   KINGDOM "), expected
+    )
+    assert get_country_rows(treated_data, "Atlantis").empty
+    index = get_country_index(treated_data)
+    assert index.get_name("germany") == "Germany"
+    assert sum(len(positions) for positions in index.positions.values()) == len(
+        treated_data
+    )
+
+
+def test_aggregate_cube():
+    cube = get_aggregate_cube(treated_data)
+    # every dimension exists in the menu frames
+    assert cube.dimensions == CUBE_DIMENSIONS
+    by_country = cube.rollup("Country")
+    stats_pandas = treated_data.groupby("Country")["Salary in USD"].agg(
+        ["count", "mean", "std", "min", "max"]
+    )
+    assert np.allclose(by_country["count"], stats_pandas["count"])
+    assert np.allclose(by_country["mean"], stats_pandas["mean"])
+    assert np.allclose(by_country["std"], stats_pandas["std"], equal_nan=True)
+    assert np.allclose(by_country["min"], stats_pandas["min"])
+    assert np.allclose(by_country["max"], stats_pandas["max"])
+    assert np.isclose(cube.total()["mean"], treated_data["Salary in USD"].mean())
+
+
+def test_country_stats():
+    rows = treated_data[treated_data["Country"] == "Canada"]
+    stats = get_country_stats(treated_data, "canada")
+    assert stats["responses"] == len(rows)
+    assert np.isclose(stats["average_salary"], rows["Salary in USD"].mean())
+    assert stats["highest_salary"] == rows["Salary in USD"].max()
+    assert stats["lowest_salary"] == rows["Salary in USD"].min()
+    assert stats["most_common_job"] == rows["Job category"].mode().values[0]
+    assert (
+        stats["most_common_employment_type"] == rows["Employment type"].mode().values[0]
+    )
+    assert get_country_stats(treated_data, "Atlantis") is None
+
+
+def test_aggregate_cube_without_outliers():
+    filtered = treated_data[~get_outlier_mask(treated_data)]
+    assert np.isclose(
+        get_aggregate_cube(filtered).total()["max"], filtered["Salary in USD"].max()
+    )
+    assert np.isclose(
+        get_aggregate_cube(treated_data).total()["max"],
+        treated_data["Salary in USD"].max(),
+    )
+
+
+def test_generate_dataset(tmp_path):
+    synthetic = pd.read_csv(generate_dataset(str(tmp_path / "synthetic.csv"), 2500))
+    assert list(synthetic.columns) == list(data_file.columns)
+    assert len(synthetic) == 2500
+    assert set(synthetic["job_category"]) <= set(data_file["job_category"])
+    assert synthetic["salary_in_usd"].min() > 0
+
+
+def test_chunked_dataset():
+    chunked = ChunkedDataset(file_path, chunksize=1000)
+    assert chunked.shape[0] == len(treated_data)
+    assert np.isclose(
+        get_aggregate_cube(chunked).total()["mean"],
+        treated_data["Salary in USD"].mean(),
+    )
+    by_country = get_aggregate_cube(chunked).rollup("Country")
+    assert np.allclose(
+        by_country["mean"], treated_data.groupby("Country")["Salary in USD"].mean()
+    )
+    stats_chunked = get_country_stats(chunked, "spain")
+    stats_memory = get_country_stats(treated_data, "spain")
+    for key, value in stats_memory.items():
+        if isinstance(value, str):
+            assert stats_chunked[key] == value
+        else:
+            assert np.isclose(stats_chunked[key], value)
+    pd.testing.assert_frame_equal(
+        get_country_rows(chunked, "Spain"), get_country_rows(treated_data, "Spain")
+    )
+
+
+def test_chunked_outliers():
+    chunked = ChunkedDataset(file_path, chunksize=1000)
+    for group_by in [None, "Experience level"]:
+        mask = get_outlier_mask(treated_data, 2.5, group_by)
+        outlier_filter = get_outlier_mask(chunked, 2.5, group_by)
+        assert chunked.select(outlier_filter).index.equals(treated_data[mask].index)
+        assert chunked.without(outlier_filter).shape[0] == (~mask).sum()
+
+
+def test_parallel_aggregation(tmp_path):
+    stats = aggregate_csv(file_path, workers=3)
+    parallel = StreamingPythonAnalysis(stats=stats)
+    assert stats.count == len(data_file)
+    assert np.isclose(parallel.get_average_salary(), analysis.get_average_salary())
+    assert np.isclose(parallel.get_salary_deviaton(), analysis.get_salary_deviaton())
+    assert np.isclose(
+        parallel.get_correlation_salary_years(),
+        analysis.get_correlation_salary_years(),
+    )
+    assert dict(parallel.get_job_category_frequency()) == dict(
+        analysis.get_job_category_frequency()
+    )
+    assert np.allclose(
+        parallel.get_tendency_per_year(), analysis.get_tendency_per_year()
+    )
+
+    # a directory of shards gives the same result as the single file
+    data_file.iloc[:4000].to_csv(tmp_path / "part_1.csv", index=False)
+    data_file.iloc[4000:].to_csv(tmp_path / "part_2.csv", index=False)
+    sharded = aggregate_csv(str(tmp_path), workers=2)
+    with pytest.raises(ValueError):
+        aggregate_csv(str(tmp_path), workers=2, size=100)
+    assert sharded.count == stats.count
+    assert np.isclose(sharded.m2_salary, stats.m2_salary)
+
+
+def test_parallel_cube():
+    chunked = ChunkedDataset(file_path, workers=2)
+    cube = get_aggregate_cube(chunked).rollup(["Country", "Job category"])
+    expected = treated_data.groupby(["Country", "Job category"])["Salary in USD"]
+    assert np.allclose(cube["mean"], expected.mean())
+    assert np.allclose(cube["count"], expected.count())
+
+
+def test_masked_dataset():
+    masked = MaskedDataset(treated_data)
+    first_mask = get_outlier_mask(masked)
+    first = masked.without(first_mask)
+    second = first.without(get_outlier_mask(first))
+    assert first.base is second.base is treated_data
+    assert second.removed_levels == 2
+
+    # the same results as filtering the frame
+    filtered = treated_data[~first_mask]
+    expected_mask = get_outlier_mask(filtered)
+    assert get_outlier_mask(first)[filtered.index].equals(expected_mask)
+    assert second.shape[0] == (~expected_mask).sum()
+    assert np.isclose(
+        get_aggregate_cube(first).total()["mean"], filtered["Salary in USD"].mean()
+    )
+    pd.testing.assert_frame_equal(
+        get_country_rows(first, "united states"),
+        filtered[filtered["Country"] == "United States"],
+    )
+
+    assert second.restore().shape == first.shape
+    assert second.restore().restore().shape == treated_data.shape
+
+
+def test_compact_load():
+    compact = treat_axis(get_data_pd(list(COLUMN_NAMES), compact=True))
+    assert list(compact.columns) == list(treated_data.columns)
+    assert compact["Country"].dtype == "category"
+    assert compact["Salary in USD"].dtype == np.int32
+    assert (
+        compact.memory_usage(deep=True).sum()
+        < treated_data.memory_usage(deep=True).sum() / 4
+    )
+    pd.testing.assert_frame_equal(
+        compact.astype(treated_data.dtypes.to_dict()), treated_data
+    )
+
+    stats = get_country_stats(compact, "Germany")
+    assert stats == get_country_stats(treated_data, "Germany")
+    assert get_outlier_mask(compact, 2, "Country").equals(
+        get_outlier_mask(treated_data, 2, "Country")
+    )
+    compact_categories = get_job_categories_plan(compact).collect()
+    categories = get_job_categories_plan(treated_data).collect()
+    assert compact_categories.astype(str).equals(categories.astype(str))
+
+
+def test_format_currency_column():
+    amounts = pd.Series([0, 5.5, -5.5, 1234567.891, 999.999, -0.004])
+    assert format_currency_column(amounts).tolist() == [
+        format_currency(amount) for amount in amounts
+    ]
+    assert format_currency_column(amounts, "EUR").tolist() == [
+        format_currency(amount, "EUR") for amount in amounts
+    ]
+
+
+def test_table_pager(monkeypatch):
+    country_rows = get_country_rows(treated_data, "United States")
+    pager = TablePager(country_rows, 20, {"Salary in USD": format_currency_column})
+    assert pager.page_count == -(-len(country_rows) // 20)
+
+    first_page = pager.get_page(0)
+    assert len(first_page) == 20
+    assert first_page.index.equals(country_rows.index[:20])
+    assert first_page["Salary in USD"].iloc[0] == format_currency(
+        country_rows["Salary in USD"].iloc[0]
+    )
+    assert country_rows["Salary in USD"].dtype != object  # source left unformatted
+
+    assert "Page 1 of" in pager.head()
+    assert "Page 2 of" in pager.next()
+    assert "Page 1 of" in pager.prev()
+    assert "Page 1 of" in pager.prev()  # stays on the first page
+    pager.render(pager.page_count + 5)
+    assert pager.page == pager.page_count - 1
+
+    answers = iter(["n", "n", "p", ""])
+    pager.browse(lambda prompt: next(answers))
+    assert pager.page == 1
+    # without ask, input() is looked up when browsing, so a patched input() is used
+    answers = iter(["n", ""])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    pager.browse()
+    assert pager.page == 1
+    assert "Page" not in TablePager(country_rows.head(3)).head()
+
+
+def test_export_partitions(tmp_path):
+    outliers = get_outlier_mask(treated_data, 2)
+    dataset = MaskedDataset(treated_data).without(outliers)
+    active = treated_data[~outliers]
+
+    manifest = export_partitions(dataset, tmp_path / "gz", file_format="csv.gz")
+    counts = active["Country"].value_counts()
+    assert manifest["rows"] == len(active)
+    assert {item["value"]: item["rows"] for item in manifest["partitions"]} == dict(
+        counts
+    )
+    with open(tmp_path / "gz" / "manifest.json") as file:
+        assert json.load(file) == manifest
+    germany = pd.read_csv(tmp_path / "gz" / "Germany_data.csv.gz")
+    assert len(germany) == counts["Germany"]
+    assert (
+        germany["Salary in USD"].sum()
+        == active.loc[active["Country"] == "Germany", "Salary in USD"].sum()
+    )
+
+    # chunks are appended to the files written by the previous chunks
+    chunked = ChunkedDataset(file_path, chunksize=1000)
+    chunked_manifest = export_partitions(chunked, tmp_path / "csv", workers=2)
+    assert chunked_manifest["rows"] == len(treated_data)
+    spain = pd.read_csv(tmp_path / "csv" / "Spain_data.csv")
+    assert spain.equals(
+        treated_data[treated_data["Country"] == "Spain"].reset_index(drop=True)
+    )
+
+    export_partitions(dataset, tmp_path / "npy", "Experience level", "npy")
+    with open(tmp_path / "npy" / "Senior_data.npy" / "meta.json") as file:
+        assert json.load(file)["rows"] == (active["Experience level"] == "Senior").sum()
+
+    # values with the same file name once cleaned get their own file
+    clashing = treated_data.head(30).assign(
+        **{"Job category": ["A/B", "A_B", "a_b"] * 10}
+    )
+    clash_manifest = export_partitions(clashing, tmp_path / "clash", "Job category")
+    files = {item["value"]: item["file"] for item in clash_manifest["partitions"]}
+    assert files == {
+        "A/B": "A_B_data.csv",
+        "A_B": "A_B_2_data.csv",
+        "a_b": "a_b_3_data.csv",
+    }
+    for value, file_name in files.items():
+        assert len(pd.read_csv(tmp_path / "clash" / file_name)) == 10
+    with pytest.raises(ValueError):
+        export_partitions(chunked, tmp_path / "chunked_npy", file_format="npy")
+
+
+def test_batch_queries():
+    dataset = MaskedDataset(treated_data)
+    lines = [
+        '{"id": 1, "query": "average_salary"}',
+        "",
+        "# comments and blank lines are skipped",
+        '{"id": 2, "query": "country_summary", "country": "spain"}',
+        '{"id": 3, "query": "outliers", "threshold": 2, "group_by": "Country", "limit": 5}',
+        '{"id": 4, "query": "job_categories", "country": "Germany"}',
+        '{"id": 5, "query": "average_salary_by_country"}',
+        '{"id": 6, "query": "country_summary", "country": "Atlantis"}',
+        '{"id": 7, "query": "country_summary"}',
+        '{"id": 8, "query": "unknown"}',
+        "not json",
+    ]
+    output = io.StringIO()
+    assert run_batch(dataset, lines, output) == 9
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [response["id"] for response in responses] == [1, 2, 3, 4, 5, 6, 7, 8, None]
+
+    assert np.isclose(
+        responses[0]["result"]["average_salary"], treated_data["Salary in USD"].mean()
+    )
+    assert responses[1]["result"]["country"] == "Spain"
+    assert (
+        responses[1]["result"]["responses"]
+        == get_country_stats(treated_data, "Spain")["responses"]
+    )
+    mask = get_outlier_mask(treated_data, 2, "Country")
+    assert responses[2]["result"]["count"] == mask.sum()
+    assert len(responses[2]["result"]["rows"]) == 5
+    assert {row["country"] for row in responses[3]["result"]} == {"Germany"}
+    assert len(responses[4]["result"]) == treated_data["Country"].nunique()
+    # one response per query, failures included
+    for response in responses[5:]:
+        assert "error" in response and "result" not in response
+
+
+def test_query_service():
+    async def request(port, method, target, body=b""):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(payload)
+
+    async def scenario():
+        service = QueryService(MaskedDataset(treated_data), workers=2)
+        service.warm_up()
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            status, response = await request(port, "GET", "/average_salary")
+            assert status == 200
+            assert np.isclose(
+                response["result"]["average_salary"],
+                treated_data["Salary in USD"].mean(),
+            )
+
+            status, response = await request(
+                port, "GET", "/outliers?threshold=2&group_by=Country&limit=3"
+            )
+            assert status == 200
+            assert (
+                response["result"]["count"]
+                == get_outlier_mask(treated_data, 2, "Country").sum()
+            )
+
+            body = json.dumps({"id": 7, "query": "country_summary", "country": "spain"})
+            status, response = await request(port, "POST", "/query", body.encode())
+            assert (status, response["id"]) == (200, 7)
+            assert response["result"]["country"] == "Spain"
+
+            assert (await request(port, "GET", "/nothing"))[0] == 404
+            assert (await request(port, "GET", "/country_summary"))[0] == 400
+
+            # identical queries running at the same time are computed once
+            query = {"query": "outliers", "threshold": 2.5}
+            responses = await asyncio.gather(
+                *[service.answer(dict(query, id=i)) for i in range(5)]
+            )
+            assert [response["id"] for response in responses] == list(range(5))
+            assert service.metrics.coalesced == 4
+
+            status, metrics = await request(port, "GET", "/metrics")
+            endpoints = metrics["endpoints"]
+            assert endpoints["average_salary"]["requests"] == 1
+            assert endpoints["country_summary"]["errors"] == 1
+            assert endpoints["outliers"]["p95_seconds"] > 0
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    asyncio.run(scenario())
+
+
+def test_profiler(tmp_path, monkeypatch):
+    def slow_input(*args):
+        time.sleep(0.2)
+        return ""
+
+    monkeypatch.setattr("builtins.input", slow_input)
+    profiler.reset()
+    profiler.enable(str(tmp_path / "report.json"), memory=True)
+    try:
+        with profiler.timer("menu option 6"):
+            stats = get_country_stats(MaskedDataset(treated_data), "Spain")
+            input("waiting for the user is not timed")
+        analysis.get_average_salary()
+        report = profiler.write_report()
+    finally:
+        profiler.disable()
+        profiler.reset()
+
+    timers = report["timers"]
+    assert stats["country"] == "Spain"
+    assert timers["menu option 6"]["calls"] == 1
+    assert timers["menu option 6"]["total_seconds"] < 0.2
+    assert timers["menu option 6"]["peak_bytes"] > 0
+    assert timers["menu option 6"]["phases"]["aggregate"] > 0
+    assert timers["get_country_stats"]["phases"]["aggregate"] > 0
+    assert timers["VanillaPythonAnalysis.get_average_salary"]["calls"] == 1
+    with open(tmp_path / "report.json") as file:
+        assert json.load(file)["timers"].keys() == timers.keys()
+
+    # nothing is recorded once disabled
+    get_country_stats(treated_data, "Spain")
+    assert profiler.get_report()["timers"] == {}
+
+
+def test_incremental_ingestion(tmp_path):
+    csv_file = tmp_path / "jobs.csv"
+    data_file.iloc[:6000].to_csv(csv_file, index=False)
+    base = treat_axis(load_frame(str(csv_file), list(COLUMN_NAMES), compact=True))
+    outliers = get_outlier_mask(base, 2)
+    dataset = MaskedDataset(base).without(outliers)
+    get_aggregate_cube(dataset)
+    get_salary_sketches(dataset)
+    tail_reader = get_tail_reader(str(csv_file))
+    streaming = StreamingPythonAnalysis(str(csv_file))
+    vanilla = VanillaPythonAnalysis(str(csv_file))
+    columnar = VanillaPythonAnalysis(
+        columns={name: data_file[name].iloc[:6000].tolist() for name in data_file},
+        tail=TailReader(str(csv_file)),
+    )
+
+    # the last appended row is still being written
+    last_row = data_file.iloc[9000:9001].to_csv(index=False, header=False)
+    with open(csv_file, "a") as file:
+        file.write(data_file.iloc[6000:9000].to_csv(index=False, header=False))
+        file.write(last_row[:10])
+
+    dataset, new_rows = ingest_appended_rows(dataset, tail_reader)
+    assert new_rows == 3000
+    # the sketches were merged, not rebuilt
+    sketches = get_cached_result(dataset, "salary_sketches")
+    assert sketches is not None and sketches.total.count == dataset.shape[0]
+    assert streaming.update() == vanilla.update() == columnar.update() == 3000
+    # the appended values have the type of the cached columns
+    by_year = columnar.group_by("work_year").count()
+    expected_years = data_file["work_year"].iloc[:9000].value_counts()
+    assert by_year == expected_years.to_dict()
+    assert columnar.get_tendency_per_year() == vanilla.get_tendency_per_year()
+    expected = treat_axis(data_file.iloc[:9000])
+    active = np.concatenate([~outliers.to_numpy(), np.ones(3000, dtype=bool)])
+    assert dataset.shape[0] == active.sum()
+    assert dataset.base["Country"].dtype == "category"
+    assert list(dataset.base["Country"].cat.categories) == sorted(
+        expected["Country"].unique()
+    )
+    assert dataset.base.astype(expected.dtypes.to_dict()).equals(expected)
+    merged = get_aggregate_cube(dataset).rollup("Country")
+    rebuilt = AggregateCube(dataset.base, mask=active).rollup("Country")
+    assert np.allclose(
+        merged[["count", "sum", "min", "max"]], rebuilt[["count", "sum", "min", "max"]]
+    )
+    assert dataset.restore().shape[0] == 9000
+
+    full = StreamingPythonAnalysis(
+        columns={
+            name: data_file[name].iloc[:9000].tolist()
+            for name in [
+                "salary_in_usd",
+                "work_year",
+                "job_category",
+                "employee_residence",
+            ]
+        }
+    )
+    for method in [
+        "get_average_salary",
+        "get_salary_deviaton",
+        "get_correlation_salary_years",
+    ]:
+        assert np.isclose(getattr(streaming, method)(), getattr(full, method)())
+        assert np.isclose(getattr(vanilla, method)(), getattr(full, method)())
+    assert streaming.get_tendency_per_year() == full.get_tendency_per_year()
+    assert streaming.get_job_category_frequency() == full.get_job_category_frequency()
+
+    # the rest of the partial row arrives
+    with open(csv_file, "a") as file:
+        file.write(last_row[10:])
+    dataset, new_rows = ingest_appended_rows(dataset, tail_reader)
+    assert new_rows == 1 and dataset.shape[0] == active.sum() + 1
+    assert streaming.update() == 1 and streaming.stats.count == 9001
+    assert ingest_appended_rows(dataset, tail_reader)[1] == 0
+
+    data_file.iloc[:100].to_csv(csv_file, index=False)
+    with pytest.raises(ValueError):
+        ingest_appended_rows(dataset, tail_reader)
+
+
+def test_no_trailing_newline(tmp_path):
+    csv_file = tmp_path / "jobs.csv"
+    csv_file.write_text(data_file.iloc[:100].to_csv(index=False).rstrip("\n"))
+    path = str(csv_file)
+    # the initial load reads the last row, even without its newline
+    assert len(VanillaPythonAnalysis(path).salaries) == 100
+    streaming = StreamingPythonAnalysis(path)
+    assert streaming.stats.count == 100
+    assert aggregate_csv(path, 2, TailReader(path).offset).count == 100
+    tail_reader = TailReader(path)
+    dataset = MaskedDataset(treat_axis(load_frame(path, list(COLUMN_NAMES))))
+    assert dataset.shape[0] == 100
+
+    # the rows appended after it are read once they are complete
+    with open(csv_file, "a") as file:
+        file.write("\n" + data_file.iloc[100:110].to_csv(index=False, header=False))
+        file.write(data_file.iloc[110:111].to_csv(index=False, header=False)[:10])
+    assert streaming.update() == 10 and streaming.stats.count == 110
+    dataset, new_rows = ingest_appended_rows(dataset, tail_reader)
+    assert new_rows == 10 and dataset.shape[0] == 110
+
+
+def test_fast_startup():
+    # the menu only needs the standard library, pandas is imported by the background load
+    imported = subprocess.run(
+        [sys.executable, "-c", "import main, sys; print('pandas' in sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert imported.stdout.strip() == "False"
+
+    def load(value):
+        if value is None:
+            raise LookupError("no data")
+        return value * 2
+
+    assert main.BackgroundLoad(load, 21).result() == 42
+    with pytest.raises(LookupError):
+        main.BackgroundLoad(load, None).result()
+
+
+def test_engine_parity():
+    columns = {
+        name: data_file[name].tolist()
+        for name in ["salary_in_usd", "work_year", "job_category", "employee_residence"]
+    }
+    reference = VanillaPythonAnalysis(columns=columns, engine="python")
+    # the python engine groups with the GroupByAggregator of group_by
+    assert (
+        dict(reference.get_tendency_per_year())
+        == reference.group_by("work_year").mean()
+    )
+    assert isinstance(
+        reference.get_engine().group_by(reference.job_categories), GroupByAggregator
+    )
+    assert get_available_engines() == ["python", "numpy", "pandas"]
+    for engine in get_available_engines():
+        engine_analysis = VanillaPythonAnalysis(
+            columns={name: list(values) for name, values in columns.items()},
+            engine=engine,
+        )
+        assert engine_analysis.get_engine().name == engine
+        for method in [
+            "get_average_salary",
+            "get_salary_deviaton",
+            "get_years_deviaton",
+            "get_correlation_salary_years",
+        ]:
+            assert np.allclose(
+                getattr(engine_analysis, method)(), getattr(reference, method)()
+            )
+        assert (
+            engine_analysis.get_job_category_frequency()
+            == reference.get_job_category_frequency()
+        )
+        for method in [
+            "get_tendency_per_year",
+            "get_average_salary_by_country",
+            "get_average_salary_by_category",
+        ]:
+            result = getattr(engine_analysis, method)()
+            expected = getattr(reference, method)()
+            assert [key for key, _ in result] == [key for key, _ in expected]
+            assert np.allclose(
+                [value for _, value in result], [value for _, value in expected]
+            )
+        assert engine_analysis.get_lowest_salary() == data_file["salary_in_usd"].min()
+        assert engine_analysis.get_highest_salary() == data_file["salary_in_usd"].max()
+        assert (
+            engine_analysis.get_salary_quantiles() == reference.get_salary_quantiles()
+        )
+        assert (
+            engine_analysis.get_salary_quantiles_by_category()
+            == reference.get_salary_quantiles_by_category()
+        )
+        assert (
+            engine_analysis.get_salary_histogram() == reference.get_salary_histogram()
+        )
+
+        # appended rows are seen by the engine
+        engine_analysis.add_records(
+            [
+                {
+                    "salary_in_usd": "1000000",
+                    "work_year": "2024",
+                    "job_category": "Data Science and Research",
+                    "employee_residence": "Spain",
+                }
+            ]
+        )
+        assert engine_analysis.get_highest_salary() == 1000000
+
+    assert select_engine(NUMPY_MIN_ROWS - 1).name == "python"
+    assert select_engine(NUMPY_MIN_ROWS).name == "numpy"
+    with pytest.raises(ValueError):
+        VanillaPythonAnalysis(columns=columns, engine="spark")
+
+
+def get_rank_error(values, value, quantile):
+    return abs(np.searchsorted(values, value, side="right") / len(values) - quantile)
+
+
+def test_quantile_sketches():
+    rng = np.random.default_rng(0)
+    salaries = rng.lognormal(11, 0.5, 200_000)
+    exact = np.sort(salaries)
+    quantiles = {"p1": 0.01, **DEFAULT_QUANTILES}
+
+    # exact until the first compaction, with numpy's inverted_cdf definition
+    small = QuantileSketch().update(salaries[:150].tolist())
+    assert list(small.quantiles(quantiles).values()) == list(
+        np.quantile(salaries[:150], list(quantiles.values()), method="inverted_cdf")
+    )
+
+    # added in bulk, one by one or merged from parts: bounded size, rank error below 1%
+    bulk = QuantileSketch().update(salaries.tolist())
+    one_by_one = QuantileSketch()
+    for salary in salaries[:50_000].tolist():
+        one_by_one.add(salary)
+    merged = QuantileSketch()
+    for start in range(0, len(salaries), 20_000):
+        merged.merge(QuantileSketch().update(salaries[start : start + 20_000].tolist()))
+    for sketch, values in [
+        (bulk, exact),
+        (one_by_one, np.sort(salaries[:50_000])),
+        (merged, exact),
+    ]:
+        assert sketch.size < 4 * sketch.k
+        assert sum(weight for _, weight in sketch.get_weighted_items()) == sketch.count
+        for name, value in sketch.quantiles(quantiles).items():
+            assert get_rank_error(values, value, quantiles[name]) < 0.01
+        histogram = sketch.histogram()
+        assert sum(count for _, _, count in histogram) == sketch.count
+        assert histogram[0][0] == values[0] and histogram[-1][1] == values[-1]
+
+    # the streaming analysis estimates what the vanilla one computes exactly
+    streaming = StreamingPythonAnalysis(file_path)
+    salaries = np.sort(data_file["salary_in_usd"].to_numpy())
+    for name, value in streaming.get_salary_quantiles().items():
+        assert get_rank_error(salaries, value, DEFAULT_QUANTILES[name]) < 0.01
+    assert [
+        category for category, _ in streaming.get_salary_quantiles_by_category()
+    ] == [category for category, _ in analysis.get_salary_quantiles_by_category()]
+
+    # small groups are exact, in memory and chunk by chunk
+    spain = treated_data.loc[treated_data["Country"] == "Spain", "Salary in USD"]
+    expected = np.quantile(
+        spain, list(DEFAULT_QUANTILES.values()), method="inverted_cdf"
+    )
+    for dataset in [treated_data, ChunkedDataset(file_path, 2000)]:
+        stats = get_country_stats(dataset, "spain")
+        assert [stats[f"{name}_salary"] for name in DEFAULT_QUANTILES] == list(expected)
+        assert get_salary_sketches(dataset).total.count == len(treated_data)
+
+    response = run_query(
+        treated_data,
+        {"query": "salary_distribution", "by": "Country", "value": "spain"},
+    )
+    assert response["result"]["count"] == len(spain)
+    assert response["result"]["quantiles"]["median"] == expected[1]
+    assert sum(item["count"] for item in response["result"]["histogram"]) == len(spain)
+
+
+def test_correlation_matrix(monkeypatch):
+    features = encode_features(data_file)
+    assert not np.isnan(features).any()
+    expected = np.corrcoef(features, rowvar=False)
+    # blocks of rows merged, and the csv file streamed in chunks
+    total, groups = accumulate_covariance([data_file], "job_category", block_rows=1000)
+    assert total.count == len(data_file)
+    assert np.allclose(total.covariance(), np.cov(features, rowvar=False, bias=True))
+    assert np.allclose(total.correlation(), expected, equal_nan=True)
+    assert np.isclose(
+        total.correlation().loc["salary_in_usd", "work_year"],
+        analysis.get_correlation_salary_years(),
+    )
+    assert list(total.correlation().columns) == FEATURE_NAMES
+    for category, rows in data_file.groupby("job_category"):
+        assert groups[category].count == len(rows)
+        assert np.allclose(
+            groups[category].covariance(),
+            np.cov(encode_features(rows), rowvar=False, bias=True),
+        )
+    chunked = ChunkedDataset(file_path, chunksize=1000)
+    for data in [treated_data, MaskedDataset(treated_data), chunked]:
+        streamed, by_country = get_correlations(data, "employee_residence")
+        assert np.allclose(streamed.correlation(), expected, equal_nan=True)
+        assert sum(group.count for group in by_country.values()) == len(data_file)
+        assert get_correlations(data, "employee_residence")[0] is streamed
+    # the chunked dataset streams the extra columns instead of loading the file
+    monkeypatch.setattr("functions.load_frame", None)
+    streamed = get_correlations(ChunkedDataset(file_path, chunksize=1000))[0]
+    assert np.allclose(streamed.correlation(), expected, equal_nan=True)
+    monkeypatch.undo()
+    # only the active rows, e.g. once the outliers are removed
+    without_outliers = MaskedDataset(treated_data).without(
+        get_outlier_mask(treated_data)
+    )
+    active = data_file.loc[without_outliers.select(without_outliers.mask).index]
+    total, by_size = get_correlations(without_outliers, "company_size")
+    assert total.count == len(active) < len(data_file)
+    assert np.allclose(
+        total.correlation(),
+        np.corrcoef(encode_features(active), rowvar=False),
+        equal_nan=True,
+    )
+    assert by_size["M"].count == (active["company_size"] == "M").sum()
+
+    # unknown values leave the row out
+    unknown = data_file.head(10).assign(company_size=["XL"] + ["M"] * 9)
+    assert accumulate_covariance([unknown])[0].count == 9
+    with pytest.raises(ValueError):
+        get_correlations(treated_data, "salary")
+
+
+def test_query_plans():
+    plan = get_job_categories_plan(treated_data, " spain ")
+    steps = plan.explain()
+    assert steps.index("cube slice Country=' spain '") < steps.index(
+        "rollup by ['Country', 'Job category']"
+    )
+    assert query(treated_data).filter("Country", "Spain").explain() == [
+        "country index lookup 'Spain'"
+    ]
+    spain = treated_data[treated_data["Country"] == "Spain"]
+    expected = spain.groupby("Job category")["Salary in USD"].mean()
+    masked = MaskedDataset(treated_data)
+    chunked = ChunkedDataset(file_path, chunksize=1000)
+    for data in [treated_data, masked, chunked]:
+        rows = get_job_categories_plan(data, " spain ").collect()
+        assert list(rows["Country"].unique()) == ["Spain"]
+        assert np.allclose(rows["Salary in USD"], expected)
+        pd.testing.assert_frame_equal(
+            query(data).filter("Country", "spain").collect(), spain
+        )
+        # a filter outside the cube dimensions scans the rows instead
+        remote = (
+            query(data)
+            .filter("Country", "Spain")
+            .filter("Work setting", "Remote")
+            .group_by("Experience level")
+            .aggregate(count="count", average="mean")
+        )
+        assert "row filter Work setting='Remote'" in remote.explain()
+        remote_rows = spain[spain["Work setting"] == "Remote"]
+        result = remote.collect().set_index("Experience level")
+        grouped = remote_rows.groupby("Experience level")["Salary in USD"]
+        assert result["count"].tolist() == grouped.count().tolist()
+        assert np.allclose(result["average"], grouped.mean())
+        assert get_job_categories_plan(data, "Atlantis").collect().empty
+
+    # the rows stay numeric, they are formatted one page at a time
+    plan = get_job_categories_plan(treated_data)
+    pager = plan.pager(5)
+    assert pager.data["Salary in USD"].dtype == "float64"
+    page = pager.get_page(1)
+    assert (
+        page["Salary in USD"].tolist()
+        == format_currency_column(pager.data["Salary in USD"].iloc[5:10]).tolist()
+    )